@@ -0,0 +1,263 @@
+#
+# Benchmarks for the Monte Carlo simulation of the
+# Gruenbichler-Longstaff (1996) square-root diffusion
+#
+# (c) The Python Quants GmbH
+# For illustration purposes only.
+# August 2014
+#
+import sys
+import json
+import math
+import time
+import platform
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import scipy
+from pricing_formulae import (call_price, cv_estimator, generate_paths,
+                              make_generator, qmc_estimator,
+                              streaming_estimator)
+
+# Model parameters of the benchmarks; sigma_V = 2.0 gives d > 1,
+# sigma_V = 20.0 gives d <= 1 (branches of the exact transition)
+x0, kappa, theta, T, r = 17.5, 0.1, 20.0, 1.0, 0.01
+strikes = np.linspace(0.75, 1.25, 11) * x0  # option chain
+
+# Variance reduction methods: estimator and keyword arguments
+methods = [('plain', streaming_estimator, {}),
+           ('mo_match', streaming_estimator, {'mo_match': True}),
+           ('anti_paths', streaming_estimator, {'anti_paths': True}),
+           ('mo_match+anti_paths', streaming_estimator,
+            {'mo_match': True, 'anti_paths': True}),
+           ('control_variates', cv_estimator, {}),
+           ('qmc', qmc_estimator, {'replications': 4})]
+
+
+def legacy_generate_paths(x0, kappa, theta, sigma, T, M, I, rng):
+    ''' Previous simulation kernel (full matrix of normal rv, temporary
+    arrays in every time step), kept as reference for the benchmarks. '''
+    dt = T / M
+    x = np.zeros((M + 1, I), dtype='d')
+    x[0, :] = x0
+    ran = rng.standard_normal((M + 1, I))
+    d = 4 * kappa * theta / sigma ** 2
+    c = (sigma ** 2 * (1 - math.exp(-kappa * dt))) / (4 * kappa)
+    if d > 1:
+        for t in range(1, M + 1):
+            l = x[t - 1, :] * math.exp(-kappa * dt) / c
+            chi = rng.chisquare(d - 1, I)
+            x[t, :] = c * ((ran[t] + np.sqrt(l)) ** 2 + chi)
+    else:
+        for t in range(1, M + 1):
+            l = x[t - 1, :] * math.exp(-kappa * dt) / c
+            N = rng.poisson(l / 2, I)
+            chi = rng.chisquare(d + 2 * N, I)
+            x[t, :] = c * chi
+    return x
+
+
+def measure(func, *args, **kwargs):
+    ''' Runs func once and returns the result, the wall-clock time in
+    seconds and the peak memory in bytes allocated during the call
+    beyond the memory held by the result itself. '''
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    t0 = time.time()
+    result = func(*args, **kwargs)
+    seconds = time.time() - t0
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return result, seconds, peak - getattr(result, 'nbytes', 0)
+
+
+def kernel_benchmark(M=100, I=150000, sigma=2.0, repeat=3, seed=100000):
+    ''' Compares throughput and scratch memory of the legacy simulation
+    kernel with the allocation-free kernel of generate_paths.
+
+    M: int
+        number of time intervals
+    I: int
+        number of simulation paths
+    sigma: float
+        volatility of volatility (2.0: d > 1, 20.0: d <= 1)
+    repeat: int
+        number of repetitions (the best time is reported)
+
+    Returns
+    =======
+    results: dict
+        per kernel: best time in seconds, throughput in path steps per
+        second and peak scratch memory in path vectors (I float64 values)
+    '''
+    kernels = [('legacy', legacy_generate_paths, {}),
+               ('in-place', generate_paths, {}),
+               ('in-place terminal', generate_paths,
+                {'terminal_only': True})]
+    results = {}
+    for name, func, kwargs in kernels:
+        times, scratch = [], 0
+        for _ in range(repeat):
+            rng = make_generator(seed)
+            _, seconds, peak = measure(func, x0, kappa, theta, sigma, T,
+                                       M, I, rng=rng, **kwargs)
+            times.append(seconds)
+            scratch = max(scratch, peak)
+        results[name] = {'seconds': min(times),
+                         'path_steps_per_sec': M * I / min(times),
+                         'scratch_vectors': scratch / (8. * I)}
+    return results
+
+
+def estimator_benchmark(sigma=2.0, steps_list=(25, 50, 100),
+                        paths_list=(8192, 32768), replications=5,
+                        seed=100000):
+    ''' Cost vs. accuracy of the Monte Carlo estimators for every variance
+    reduction method and combination of time steps and paths; every
+    estimate values the whole option chain strikes. The RMSE is taken
+    over independent replications and all strikes against call_price.
+
+    sigma: float
+        volatility of volatility (2.0: d > 1, 20.0: d <= 1; for d <= 1
+        the methods mo_match and anti_paths are skipped since they only
+        apply to the normal rv of the d > 1 branch)
+    steps_list: tuple
+        numbers of time intervals
+    paths_list: tuple
+        numbers of paths (powers of 2 for the Sobol sequences of qmc;
+        qmc uses 4 scramblings with a quarter of the paths each)
+    replications: int
+        number of independent estimates per configuration
+
+    Returns
+    =======
+    records: list
+        one dict per configuration: mean seconds per estimate, throughput
+        in path steps per second, peak memory in bytes, RMSE and the
+        efficiency 1 / (RMSE ** 2 * seconds) (accuracy per unit of time;
+        the larger, the better)
+    '''
+    benchmark = call_price(x0, kappa, theta, sigma, 0., T, r, strikes)
+    d = 4 * kappa * theta / sigma ** 2
+    records = []
+    for name, func, kwargs in methods:
+        if d <= 1 and ('mo_match' in kwargs or 'anti_paths' in kwargs):
+            continue  # no normal rv for d <= 1, same as plain
+        for M in steps_list:
+            for I in paths_list:
+                times, peak, sq_errors = [], 0, []
+                for n in range(replications):
+                    if func is qmc_estimator:
+                        args = dict(kwargs, seed=seed + n)
+                        paths = I // kwargs['replications']
+                    else:
+                        args = dict(kwargs, rng=make_generator(seed + n))
+                        paths = I
+                    if func is streaming_estimator:
+                        args['chunk_size'] = I
+                    result, seconds, memory = measure(func, x0, kappa,
+                                theta, sigma, T, r, strikes, M, paths,
+                                **args)
+                    times.append(seconds)
+                    peak = max(peak, memory)
+                    sq_errors.append((result['price'] - benchmark) ** 2)
+                seconds = np.mean(times)
+                rmse = math.sqrt(np.mean(sq_errors))
+                records.append({'benchmark': 'estimator', 'method': name,
+                                'sigma_V': sigma, 'd': d, 'steps': M,
+                                'paths': I, 'seconds': seconds,
+                                'path_steps_per_sec': M * I / seconds,
+                                'peak_bytes': peak, 'rmse': rmse,
+                                'efficiency': 1. / (rmse ** 2 * seconds)})
+    return records
+
+
+def pricing_benchmark(chain_sizes=(10, 100, 1000),
+                      backends=('cdf', 'series'), sigma=2.0, repeat=3):
+    ''' Throughput of the analytical valuation (call_price) of option
+    chains of different sizes (strikes from 50% to 150% of x0).
+
+    chain_sizes: tuple
+        numbers of strikes per chain
+    backends: tuple
+        evaluation methods of the tail probabilities (see cx)
+    repeat: int
+        number of repetitions (the best time is reported)
+
+    Returns
+    =======
+    records: list
+        one dict per chain size and backend: best time in seconds,
+        options per second and peak memory in bytes
+    '''
+    records = []
+    for backend in backends:
+        for n in chain_sizes:
+            chain = np.linspace(0.5, 1.5, n) * x0
+            times, peak = [], 0
+            for _ in range(repeat):
+                _, seconds, memory = measure(call_price, x0, kappa, theta,
+                                             sigma, 0., T, r, chain,
+                                             backend=backend)
+                times.append(seconds)
+                peak = max(peak, memory)
+            records.append({'benchmark': 'call_price', 'backend': backend,
+                            'strikes': n, 'seconds': min(times),
+                            'options_per_sec': n / min(times),
+                            'peak_bytes': peak})
+    return records
+
+
+def run_suite(quick=False):
+    ''' Runs all benchmarks and returns the results together with the
+    environment they were obtained in (for comparisons over time).
+
+    quick: bool
+        small configurations only (smoke test of the suite)
+    '''
+    if quick:
+        est = {'steps_list': (10,), 'paths_list': (1024,),
+               'replications': 2}
+        kernel = {'M': 10, 'I': 10000, 'repeat': 1}
+    else:
+        est, kernel = {}, {}
+    records = []
+    for sigma in (2.0, 20.0):
+        for name, res in sorted(kernel_benchmark(sigma=sigma,
+                                                 **kernel).items()):
+            records.append(dict(res, benchmark='kernel', kernel=name,
+                                sigma_V=sigma))
+        records.extend(estimator_benchmark(sigma=sigma, **est))
+    records.extend(pricing_benchmark())
+    return {'date': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__, 'scipy': scipy.__version__,
+            'machine': platform.machine(), 'processor': platform.processor(),
+            'quick': quick, 'results': records}
+
+
+def write_json(suite, filename):
+    ''' Writes the results of run_suite as JSON file. '''
+    with open(filename, 'w') as f:
+        json.dump(suite, f, indent=1, default=float)
+
+
+if __name__ == '__main__':
+    # usage: python benchmarks.py [output.json] [--quick]
+    args = [arg for arg in sys.argv[1:] if arg != '--quick']
+    suite = run_suite(quick='--quick' in sys.argv)
+    output = args[0] if args else datetime.now().strftime(
+        'benchmarks_%Y%m%d_%H%M%S.json')
+    write_json(suite, output)
+    print("{:>20s} {:>7s} {:>6s} {:>7s} {:>10s} {:>16s} {:>10s} {:>12s}"
+          .format('method', 'sigma', 'steps', 'paths', 'seconds',
+                  'path steps/sec', 'RMSE', 'efficiency'))
+    for res in suite['results']:
+        if res['benchmark'] == 'estimator':
+            print("{:>20s} {:7.1f} {:6d} {:7d} {:10.4f} {:16.0f} {:10.5f} "
+                  "{:12.0f}".format(res['method'], res['sigma_V'],
+                  res['steps'], res['paths'], res['seconds'],
+                  res['path_steps_per_sec'], res['rmse'],
+                  res['efficiency']))
+    print("Results written to %s" % output)
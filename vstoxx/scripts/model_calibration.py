@@ -9,13 +9,17 @@
 # For illustration purposes only.
 # August 2014
 #
+import logging
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
-from pricing_formulae import call_price
+from pricing_formulae import call_greeks, call_price
+from monitoring import get_logger, log_event
 import scipy.optimize as sco
 import matplotlib.pyplot as plt
 
 path = 'source/data/'
+logger = get_logger('model_calibration')
 
 # Fixed Parameters
 r = 0.01  # risk-less short rate
@@ -34,55 +38,348 @@ def read_select_quotes(path=path):
                             & (option_data.STRIKE < (1 + tol) * V0)]
     return option_data
 
-i = 0  # counter for calibration iterations
+# Parameter grid (kappa_V, theta_V, sigma_V) of the global optimization
+grid_ranges = ((5.0, 20.1, 1.0), (10., 30.1, 1.25), (1.0, 9.1, 2.0))
 
 
-def valuation_function(p0):
-    ''' Valuation Function for set of strike prices
+def penalty(kappa_V, theta_V, sigma_V):
+    ''' Penalty for parameters violating the Feller condition or being
+    negative; floats or ndarray objects (one penalty per element). '''
+    invalid = ((2 * kappa_V * theta_V < sigma_V ** 2) | (kappa_V < 0)
+               | (theta_V < 0) | (sigma_V < 0))
+    return np.where(invalid, 1000.0, 0.)
 
-    p0: list
-        set of parameters for calibration
-    '''
+
+def mean_squared_error(call_prices, call_quotes, relative, pen,
+                       weights=None):
+    ''' MSE (relative or absolute) of model prices vs. quotes along the
+    last axis (quotes) plus penalty; weighted mean if weights (one per
+    quote, summing up to 1) are given. '''
+    if relative is True:
+        errors = ((call_prices - call_quotes) / call_quotes) ** 2
+    else:
+        errors = (call_prices - call_quotes) ** 2
+    if weights is None:
+        return np.sum(errors, axis=-1) / len(call_quotes) + pen
+    return np.sum(errors * weights, axis=-1) + pen
+
+
+def to_feller(p0):
+    ''' Maps (kappa_V, theta_V, sigma_V) to (kappa_V, theta_V, s) with
+    sigma_V = s * sqrt(2 * kappa_V * theta_V); the Feller condition
+    2 * kappa_V * theta_V >= sigma_V ** 2 is equivalent to s <= 1. '''
     kappa_V, theta_V, sigma_V = p0
-    call_prices = []
-    for strike in strikes:
-        call_prices.append(call_price(V0, kappa_V, theta_V,
-                                   sigma_V, zeta_V, ttm, r, strike))
-    return np.array(call_prices)
+    return np.array([kappa_V, theta_V,
+                     sigma_V / np.sqrt(2 * kappa_V * theta_V)])
 
-def error_function(p0):
-    ''' Error Function for Model Calibration
 
-    p0: list
-        set of parameters for calibration
+def from_feller(x):
+    ''' Inverse of to_feller. '''
+    kappa_V, theta_V, s = x
+    return np.array([kappa_V, theta_V, s * np.sqrt(2 * kappa_V * theta_V)])
+
+
+def parameter_grid(ranges=grid_ranges):
+    ''' Returns the points of the parameter grid (same order as the
+    grid of scipy.optimize.brute) as ndarray of shape (points, 3).
+
+    ranges: tuple
+        (start, stop, step) per parameter
     '''
-    global i 
-    call_prices = valuation_function(p0)
-    kappa_V, theta_V, sigma_V = p0
-    pen = 0.
-    if 2 * kappa_V * theta_V < sigma_V ** 2:
-        pen = 1000.0
-    if kappa_V < 0 or theta_V < 0 or sigma_V < 0:
-        pen = 1000.0
-    if relative is True:
-        MSE = (np.sum(((call_prices - call_quotes) / call_quotes) ** 2)
-                / len(call_quotes) + pen)
-    else:
-        MSE = np.sum((call_prices - call_quotes) ** 2) / len(call_quotes) + pen
+    grid = np.mgrid[[slice(*rng) for rng in ranges]]
+    return grid.reshape(len(ranges), -1).T
+
+
+def chunk_errors(task):
+    ''' Error function values for a chunk of parameter sets, valued
+    against all strikes in a single broadcasted call of call_price.
+    Module-level function of its arguments only (no globals), such that
+    it can be sent to worker processes.
+
+    task: tuple
+        (chunk, V0, zeta_V, ttm, r, strikes, call_quotes, relative,
+        weights) with chunk of shape (points, 3); ttm a float or one
+        time-to-maturity per quote
+    '''
+    (chunk, V0, zeta_V, ttm, r, strikes, call_quotes, relative,
+     weights) = task
+    kappa_V, theta_V, sigma_V = chunk.T[:, :, np.newaxis]
+    call_prices = call_price(V0, kappa_V, theta_V, sigma_V, zeta_V,
+                             ttm, r, strikes)  # (points, quotes)
+    return mean_squared_error(call_prices, call_quotes, relative,
+                              penalty(kappa_V, theta_V, sigma_V)[:, 0],
+                              weights)
+
+
+class Calibrator(object):
+    ''' Calibration of the GL96 model to the call quotes of a single
+    maturity or, with one time-to-maturity per quote, jointly to the
+    quotes of several maturities (see from_surface); all quotes are
+    valued in a single vectorized call. All data and the iteration
+    counter are attributes of the object, i.e. several calibrations can
+    run side by side (threads, processes); objects can be pickled.
+
+    strikes: array-like
+        strike prices of the quotes
+    call_quotes: array-like
+        call option quotes
+    ttm: float or array-like
+        time-to-maturity of the quotes (one for all or one per quote)
+    relative: bool
+        relative (MSRE) or absolute (MSAE) errors
+    weights: array-like or None
+        weights of the quotes in the MSE (None: equal weights)
+    V0, zeta_V, r: float
+        fixed parameters (defaults: module-level values)
+    '''
+
+    def __init__(self, strikes, call_quotes, ttm, relative=False,
+                 weights=None, V0=V0, zeta_V=zeta_V, r=r):
+        self.strikes = np.asarray(strikes, dtype='d')
+        self.call_quotes = np.asarray(call_quotes, dtype='d')
+        if np.ndim(ttm) > 0:
+            ttm = np.asarray(ttm, dtype='d')
+        self.ttm = ttm
+        if weights is not None:
+            weights = np.asarray(weights, dtype='d')
+            weights = weights / np.sum(weights)
+        self.quote_weights = weights
+        self.relative = relative
+        self.V0 = V0
+        self.zeta_V = zeta_V
+        self.r = r
+        self.i = 0  # counter for calibration iterations
+        self._last_sensitivities = (None, None)
+            # cache (x, (prices, jac)) of sensitivities for the last point
+            # x of the Feller parametrization (least-squares stage)
+
+    @classmethod
+    def from_quotes(cls, option_data, mat='2014-07-18', rel=False,
+                    **kwargs):
+        ''' Calibrator for the quotes of maturity mat in option_data
+        (pandas DataFrame object as returned by read_select_quotes). '''
+        # only option quotes for a single maturity
+        option_quotes = option_data[option_data.MATURITY == mat]
+        # time-to-maturity from the data set
+        ttm = option_quotes.iloc[0, -1]
+        return cls(option_quotes['STRIKE'].values,
+                   option_quotes['PRICE'].values, ttm, rel, **kwargs)
+
+    @classmethod
+    def from_surface(cls, option_data, maturities=None, rel=False,
+                     maturity_weights=None, **kwargs):
+        ''' Calibrator for the quotes of several maturities in option_data
+        (pandas DataFrame object as returned by read_select_quotes).
+
+        maturities: list or None
+            maturities to calibrate to (None: all in option_data)
+        maturity_weights: list or None
+            weight per maturity (None: equal weights); within a maturity
+            all quotes have equal weight, i.e. a maturity counts with its
+            weight independent of its number of strikes
+        '''
+        if maturities is None:
+            maturities = sorted(set(option_data.MATURITY))
+        if maturity_weights is None:
+            maturity_weights = np.ones(len(maturities))
+        option_quotes = option_data[option_data.MATURITY.isin(maturities)]
+        weights = np.zeros(len(option_quotes))
+        for mat, w in zip(maturities, maturity_weights):
+            select = (option_quotes.MATURITY == mat).values
+            weights[select] = float(w) / np.sum(select)
+        # time-to-maturity per quote from the data set
+        return cls(option_quotes['STRIKE'].values,
+                   option_quotes['PRICE'].values,
+                   option_quotes.iloc[:, -1].values, rel, weights, **kwargs)
+
+    def valuation_function(self, p0):
+        ''' Valuation Function for set of strike prices
 
-    if i == 0:
-            print ("{:>6s} {:>6s} {:>6s}".format('kappa', 'theta', 'sigma') 
-                 + "{:>12s}".format('MSE'))
+        p0: list
+            set of parameters for calibration
+        '''
+        kappa_V, theta_V, sigma_V = p0
+        # all quotes valued in a single vectorized call
+        return call_price(self.V0, kappa_V, theta_V, sigma_V, self.zeta_V,
+                          self.ttm, self.r, self.strikes)
 
-    # print intermediate results: every 100th iteration
-    if i % 100 == 0:
-        print "{:6.3f} {:6.3f} {:6.3f}".format(*p0) + "{:>12.5f}".format(MSE)
-    i += 1
-    return MSE
+    def error_function(self, p0):
+        ''' Error Function for Model Calibration
 
+        p0: list
+            set of parameters for calibration
+        '''
+        call_prices = self.valuation_function(p0)
+        kappa_V, theta_V, sigma_V = p0
+        MSE = float(mean_squared_error(call_prices, self.call_quotes,
+                                       self.relative,
+                                       penalty(kappa_V, theta_V, sigma_V),
+                                       self.quote_weights))
+        # intermediate results: every 100th iteration (DEBUG record)
+        if self.i % 100 == 0 and logger.isEnabledFor(logging.DEBUG):
+            log_event(logger, logging.DEBUG, 'calibration_iteration',
+                      ttm=np.unique(self.ttm).tolist(), iteration=self.i,
+                      kappa_V=float(kappa_V), theta_V=float(theta_V),
+                      sigma_V=float(sigma_V), MSE=MSE)
+        self.i += 1
+        return MSE
 
+    def sensitivities(self, x):
+        ''' Model prices and their derivatives w.r.t. the parameters
+        x = (kappa_V, theta_V, s) of the Feller parametrization (see
+        to_feller), from a single call of call_greeks; the results for
+        the last x are kept, as residuals and jacobian are evaluated at
+        the same points.
 
-def model_calibration(option_data, rel=False, mat='2014-07-18'):
+        Returns
+        =======
+        prices: ndarray
+            model prices (one per strike)
+        jac: ndarray
+            derivatives of shape (strikes, 3)
+        '''
+        key = tuple(x)
+        if self._last_sensitivities[0] != key:
+            kappa_V, theta_V, sigma_V = from_feller(x)
+            g = call_greeks(self.V0, kappa_V, theta_V, sigma_V, self.zeta_V,
+                            self.ttm, self.r, self.strikes)
+            # chain rule: sigma_V depends on kappa_V, theta_V and s
+            jac = np.column_stack((
+                g['kappa_V'] + g['sigma_V'] * sigma_V / (2 * kappa_V),
+                g['theta_V'] + g['sigma_V'] * sigma_V / (2 * theta_V),
+                g['sigma_V'] * np.sqrt(2 * kappa_V * theta_V)))
+            self._last_sensitivities = (key, (g['price'], jac))
+        return self._last_sensitivities[1]
+
+    def weights(self):
+        ''' Weights of the residuals such that the sum of the squared
+        residuals equals the MSE (relative or absolute). '''
+        if self.quote_weights is None:
+            w = np.ones_like(self.call_quotes) / np.sqrt(
+                len(self.call_quotes))
+        else:
+            w = np.sqrt(self.quote_weights)
+        if self.relative is True:
+            w = w / self.call_quotes
+        return w
+
+    def residuals(self, x):
+        ''' Weighted differences between model prices and quotes for
+        x = (kappa_V, theta_V, s) (see to_feller). '''
+        prices, _ = self.sensitivities(x)
+        res = (prices - self.call_quotes) * self.weights()
+        # intermediate results: every 100th iteration (DEBUG record)
+        if self.i % 100 == 0 and logger.isEnabledFor(logging.DEBUG):
+            kappa_V, theta_V, sigma_V = from_feller(x)
+            log_event(logger, logging.DEBUG, 'calibration_iteration',
+                      ttm=np.unique(self.ttm).tolist(), iteration=self.i,
+                      kappa_V=float(kappa_V), theta_V=float(theta_V),
+                      sigma_V=float(sigma_V), MSE=float(np.sum(res ** 2)))
+        self.i += 1
+        return res
+
+    def jacobian(self, x):
+        ''' Derivatives of the residuals w.r.t. x (see residuals). '''
+        _, jac = self.sensitivities(x)
+        return jac * self.weights()[:, np.newaxis]
+
+    def least_squares(self, p0, tol=1e-10, max_nfev=200):
+        ''' Local optimization by the trust region reflective method of
+        scipy.optimize.least_squares with the analytical Jacobian; the
+        Feller condition and positivity are bounds on (kappa_V, theta_V, s)
+        (see to_feller) instead of a penalty.
+
+        p0: list
+            start parameters (kappa_V, theta_V, sigma_V)
+        tol: float
+            tolerance for the termination by changes of the MSE,
+            the parameters and the gradient
+        max_nfev: int
+            maximum number of function evaluations
+        '''
+        lb, ub = (1e-6, 1e-6, 1e-6), (np.inf, np.inf, 1.)
+        x0 = np.clip(to_feller(p0), lb, ub)
+        res = sco.least_squares(self.residuals, x0, jac=self.jacobian,
+                                bounds=(lb, ub), method='trf', ftol=tol,
+                                xtol=tol, gtol=tol, max_nfev=max_nfev)
+        return from_feller(res.x)
+
+    def grid_errors(self, grid, chunk_size=256, workers=1):
+        ''' Error function values for all points of a parameter grid;
+        the points are valued in chunks of chunk_size points (bounding the
+        memory to about chunk_size * len(strikes) * 50 floats per
+        process).
+
+        grid: ndarray
+            parameter sets (kappa_V, theta_V, sigma_V) of shape (points, 3)
+        chunk_size: int
+            number of parameter sets valued per call
+        workers: int or None
+            number of worker processes (None: number of CPUs; 1: no pool)
+        '''
+        tasks = [(grid[start:start + chunk_size], self.V0, self.zeta_V,
+                  self.ttm, self.r, self.strikes, self.call_quotes,
+                  self.relative, self.quote_weights)
+                 for start in range(0, len(grid), chunk_size)]
+        if workers == 1:
+            return np.concatenate(list(map(chunk_errors, tasks)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return np.concatenate(list(pool.map(chunk_errors, tasks)))
+
+    def grid_search(self, ranges=grid_ranges, chunk_size=256, workers=1):
+        ''' Global optimization: vectorized brute force search over the
+        parameter grid (optionally spread over worker processes, see
+        grid_errors); returns the best parameter set. '''
+        grid = parameter_grid(ranges)
+        errors = self.grid_errors(grid, chunk_size, workers)
+        return grid[np.nanargmin(errors)]
+
+    def calibrate(self, workers=1, local='fmin'):
+        ''' Global and local optimization; returns the optimal parameters.
+
+        workers: int or None
+            number of processes for the global optimization
+            (None: number of CPUs; 1: no pool)
+        local: string
+            local optimization: 'fmin' (Nelder-Mead, penalty for the
+            Feller condition) or 'least_squares' (gradient-based, Feller
+            condition as bound, see least_squares)
+        '''
+        # global optimization
+        p0 = self.grid_search(grid_ranges, workers=workers)
+        # local optimization
+        self.i = 0
+        if local == 'least_squares':
+            opt = self.least_squares(p0)
+        elif local == 'fmin':
+            opt = sco.fmin(self.error_function, p0, xtol=0.0000001,
+                           ftol=0.0000001, maxiter=1000, maxfun=1500,
+                           disp=False)
+        else:
+            raise ValueError("local must be 'fmin' or 'least_squares'")
+        if logger.isEnabledFor(logging.INFO):
+            log_event(logger, logging.INFO, 'calibration_done',
+                      ttm=np.unique(self.ttm).tolist(), iterations=self.i,
+                      kappa_V=float(opt[0]), theta_V=float(opt[1]),
+                      sigma_V=float(opt[2]))
+        return opt
+
+
+calibrator = None  # last calibration run by model_calibration
+
+
+def valuation_function(p0):
+    ''' Valuation Function for the strikes of the last calibration. '''
+    return calibrator.valuation_function(p0)
+
+
+def error_function(p0):
+    ''' Error Function of the last calibration. '''
+    return calibrator.error_function(p0)
+
+
+def model_calibration(option_data, rel=False, mat='2014-07-18',
+                      workers=1, local='fmin'):
     ''' Function for global and local model calibration.
     
     option_data: pandas DataFrame object
@@ -91,49 +388,66 @@ def model_calibration(option_data, rel=False, mat='2014-07-18'):
         relative or absolute MSE
     maturity: start
         maturity of option quotes to calibrate to
+    workers: int or None
+        number of processes for the global optimization
+        (None: number of CPUs; 1: no pool)
+    local: string
+        local optimization method (see Calibrator.calibrate)
     '''
-    global relative  # if True: MSRE is used, if False: MSAE
-    global strikes
-    global call_quotes
-    global ttm
-    global i
-
-    relative = rel
-    # only option quotes for a single maturity
-    option_quotes = option_data[option_data.MATURITY == mat]
+    global calibrator
+    cal = Calibrator.from_quotes(option_data, mat, rel)
+    calibrator = cal  # for plot_calibration_results
+    return cal.calibrate(workers, local)
 
-    # time-to-maturity from the data set
-    ttm = option_quotes.iloc[0, -1]
 
-    # transform strike column and price column in ndarray object
-    strikes = option_quotes['STRIKE'].values
-    call_quotes = option_quotes['PRICE'].values
+def joint_calibration(option_data, rel=False, maturities=None,
+                      maturity_weights=None, workers=1,
+                      local='least_squares'):
+    ''' Global and local model calibration to the quotes of several
+    maturities at once (one parameter set for the whole surface).
 
-    # global optimization
-    i = 0  # counter for calibration iterations
-    p0 = sco.brute(error_function, ((5.0, 20.1, 1.0), (10., 30.1, 1.25),
-                             (1.0, 9.1, 2.0)), finish=None)
-
-    # local optimization
-    i = 0
-    opt = sco.fmin(error_function, p0, xtol=0.0000001, ftol=0.0000001,
-                                 maxiter=1000, maxfun=1500)
-
-    return opt
+    option_data: pandas DataFrame object
+        option quotes to be used
+    rel: bool
+        relative or absolute MSE
+    maturities: list or None
+        maturities to calibrate to (None: all in option_data)
+    maturity_weights: list or None
+        weight per maturity (None: equal weights)
+    workers: int or None
+        number of processes for the global optimization
+        (None: number of CPUs; 1: no pool)
+    local: string
+        local optimization method (see Calibrator.calibrate)
+    '''
+    global calibrator
+    cal = Calibrator.from_surface(option_data, maturities, rel,
+                                  maturity_weights)
+    calibrator = cal  # for plot_calibration_results
+    return cal.calibrate(workers, local)
 
 
 
-def plot_calibration_results(opt):
+def plot_calibration_results(opt, cal=None):
     ''' Function to plot market quotes vs. model prices.
 
     opt: list
         options results from calibration
+    cal: Calibrator or None
+        calibration (None: last one run by model_calibration)
     '''   
-    call_values = valuation_function(opt)
+    if cal is None:
+        cal = calibrator
+    strikes, call_quotes = cal.strikes, cal.call_quotes
+    call_values = cal.valuation_function(opt)
     diffs = call_values - call_quotes
     plt.figure()
     plt.subplot(211)
-    plt.plot(strikes, call_quotes, label='market quotes')
+    ttm = np.broadcast_to(cal.ttm, strikes.shape)
+    for T in np.unique(ttm):  # one line per maturity
+        sel = ttm == T
+        plt.plot(strikes[sel], call_quotes[sel], 'b')
+    plt.plot([], [], 'b', label='market quotes')
     plt.plot(strikes, call_values, 'ro', label='model prices')
     plt.ylabel('option values')
     plt.grid(True)
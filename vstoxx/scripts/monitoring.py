@@ -0,0 +1,161 @@
+#
+# Logging, metrics and progress reporting for
+# simulation studies and model calibrations
+# -- silent by default, machine-readable on demand
+#
+# (c) The Python Quants GmbH
+# For illustration purposes only.
+# August 2014
+#
+import sys
+import json
+import time
+import logging
+from collections import Counter
+from contextlib import contextmanager
+
+LOGGER_NAME = 'gl96'  # parent logger of all scripts
+
+logging.getLogger(LOGGER_NAME).addHandler(logging.NullHandler())
+
+
+def get_logger(name):
+    ''' Returns the logger for a script/module (child of LOGGER_NAME). '''
+    return logging.getLogger(LOGGER_NAME + '.' + name)
+
+
+def log_event(logger, level, event, **data):
+    ''' Emits a structured record if the level is enabled. The keyword
+    arguments are evaluated by the caller in any case; payloads that are
+    expensive to compute (or calls in tight loops) should be guarded
+    with logger.isEnabledFor(level).
+
+    logger: logging.Logger
+        logger to be used
+    level: int
+        logging level (e.g. logging.DEBUG)
+    event: string
+        name of the event
+    data: keyword arguments
+        payload of the record (JSON serializable values)
+    '''
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={'data': data})
+
+
+class JSONFormatter(logging.Formatter):
+    ''' Formats records as one JSON object per line. '''
+
+    def format(self, record):
+        entry = {'time': record.created, 'level': record.levelname,
+                 'logger': record.name, 'event': record.getMessage()}
+        entry.update(getattr(record, 'data', {}))
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    ''' Formats records as event followed by key=value pairs. '''
+
+    def format(self, record):
+        data = getattr(record, 'data', {})
+        return ' '.join([record.levelname, record.name, record.getMessage()]
+                        + ['%s=%s' % item for item in sorted(data.items())])
+
+
+def enable_logging(level=logging.INFO, stream=None, json_format=True):
+    ''' Attaches a stream handler to the parent logger.
+
+    level: int
+        minimum level of the records emitted
+    stream: file-like object or None
+        target of the records (None: sys.stderr)
+    json_format: bool
+        JSON lines (machine-readable) or plain text
+
+    Returns
+    =======
+    handler: logging.Handler
+        the handler (to be removed with disable_logging)
+    '''
+    handler = logging.StreamHandler(stream)
+    if json_format:
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(TextFormatter())
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    return handler
+
+
+def disable_logging(handler):
+    ''' Removes a handler attached by enable_logging. '''
+    logging.getLogger(LOGGER_NAME).removeHandler(handler)
+
+
+class Metrics(object):
+    ''' Counters and accumulated timings (in seconds). '''
+
+    def __init__(self):
+        self.counters = Counter()
+        self.timings = Counter()
+
+    def incr(self, name, n=1):
+        ''' Increments counter name by n. '''
+        self.counters[name] += n
+
+    @contextmanager
+    def timer(self, name):
+        ''' Context manager adding the elapsed time to timing name. '''
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.time() - t0
+
+    def as_dict(self):
+        ''' Counters and timings as a flat dictionary. '''
+        result = dict(self.counters)
+        for name, seconds in self.timings.items():
+            result[name + '_sec'] = seconds
+        return result
+
+
+class Progress(object):
+    ''' Rate-limited progress bar (at most one update per interval).
+
+    total: int
+        number of work items
+    interval: float
+        minimum number of seconds between two updates
+    stream: file-like object or None
+        target of the progress bar (None: sys.stderr)
+    enabled: bool
+        if False, nothing is written at all
+    '''
+
+    def __init__(self, total, interval=1.0, stream=None, enabled=True):
+        self.total = total
+        self.done = 0
+        self.interval = interval
+        self.stream = stream
+        self.enabled = enabled
+        self.t0 = self.last = time.time()
+
+    def update(self, n=1):
+        ''' Marks n further work items as done. '''
+        self.done += n
+        if not self.enabled:
+            return
+        now = time.time()
+        if now - self.last >= self.interval or self.done >= self.total:
+            self.last = now
+            width = 30
+            filled = int(width * self.done / max(self.total, 1))
+            stream = self.stream or sys.stderr
+            stream.write('\r[%s%s] %d/%d %6.1fs' % ('#' * filled,
+                         '.' * (width - filled), self.done, self.total,
+                         now - self.t0))
+            if self.done >= self.total:
+                stream.write('\n')
+            stream.flush()
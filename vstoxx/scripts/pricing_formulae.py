@@ -12,7 +12,10 @@
 #
 import math
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import scipy.stats as scs
+import scipy.special as scsp
 
 # Model parameters
 V0 = 17.5  # initial level of volatility index
@@ -44,11 +47,13 @@ def futures_price(V0, kappa_V, theta_V, zeta_V, T):
         volatility risk premium
      T: float (positive)
         time-to-maturity
+
+     All parameters may be given as floats or as broadcastable ndarrays.
     '''
     alpha = kappa_V * theta_V
     beta = kappa_V + zeta_V
-    future = (alpha / beta * (1 - math.exp(-beta * T))
-                               + math.exp(-beta * T) * V0)
+    future = (alpha / beta * (1 - np.exp(-beta * T))
+                               + np.exp(-beta * T) * V0)
     return future
 
 
@@ -56,22 +61,201 @@ def futures_price(V0, kappa_V, theta_V, zeta_V, T):
 # Semi-analytical call option pricing formula
 #
 
-def cx(K, gamma, nu, lambda_V, exact=True):
+def ncx2_sf(x, df, nc, tol=1e-14, chunk=128):
+    ''' Survival function of the non-central chi-squared distribution as
+    Poisson-weighted series of central chi-squared survival functions,
+    sum_j w_j * Q_j with w_j = Poisson(j; nc / 2) and Q_j the central
+    tail with df + 2 * j degrees of freedom.
+
+    For every element, only the terms within a window around the peak of
+    the products w_j * Q_j are summed (deep in the tail, the peak lies far
+    above the mode of the Poisson weights). The window is widened until
+    the terms at both ends are below tol times the sum, i.e. the relative
+    error is of order tol also far out in the tail. The central tails are
+    obtained by the recursion
+    Q(a + 1, y) = Q(a, y) + y ** a * exp(-y) / Gamma(a + 1), so only one
+    incomplete gamma function evaluation is needed per element.
+
+    x: float or ndarray
+        argument of the survival function
+    df: float (positive) or ndarray
+        degrees of freedom
+    nc: float (non-negative) or ndarray
+        non-centrality parameter
+    tol: float (positive)
+        relative truncation tolerance
+    chunk: int
+        number of series terms evaluated per vectorized step
+    '''
+    shape = np.broadcast(x, df, nc).shape
+    df = np.broadcast_to(np.asarray(df, dtype='d'), shape).ravel()
+    mu = np.broadcast_to(np.asarray(nc, dtype='d'), shape).ravel() / 2.
+    y = np.broadcast_to(np.maximum(x, 0.), shape).ravel() / 2.
+    tail = (y == np.inf) & np.isfinite(df + mu)  # sf(inf) = 0
+    y = np.where(tail, 0., y)
+    L = -math.log(tol)
+    # peak of w_j * Q_j: w_(j+1) / w_j = mu / (j + 1), Q_(j+1) / Q_j is
+    # about max(1, y / (df / 2 + j)); the peak is where the product is 1
+    b = 1 + df / 2.
+    peak = np.maximum(mu - 1,
+                      (np.sqrt(b ** 2 - 4 * (df / 2. - mu * y)) - b) / 2.)
+    width = np.sqrt(2 * L * (np.maximum(peak, 0.) + 1)) + L
+    sf = np.zeros(y.shape)
+    todo = np.isfinite(peak) & np.isfinite(width) & ~tail
+    while np.any(todo):
+        sf[todo], ok = _ncx2_window(y[todo], df[todo], mu[todo],
+                                    peak[todo], width[todo], tol, chunk)
+        idx = np.flatnonzero(todo)
+        todo[idx[ok]] = False
+        width[idx[~ok]] *= 2  # terms at the window ends not negligible
+    sf[(~np.isfinite(peak) | ~np.isfinite(width)) & ~tail] = np.nan
+    return sf.reshape(shape)[()]
+
+
+def _stirlerr(n):
+    ''' Error of Stirling's formula, log(n!) - log(sqrt(2 * pi * n)
+    * (n / e) ** n), for n > 0 (series for large n, see Loader 2000). '''
+    n = np.asarray(n, dtype='d')
+    nn = n * n
+    series = (1. / 12 - (1. / 360 - (1. / 1260 - (1. / 1680
+              - 1. / 1188 / nn) / nn) / nn) / nn) / n
+    with np.errstate(invalid='ignore', divide='ignore'):
+        direct = (scsp.gammaln(n + 1) - (n + 0.5) * np.log(n) + n
+                  - 0.5 * math.log(2 * math.pi))
+    return np.where(n > 15, series, direct)
+
+
+def _bd0(x, m):
+    ''' Deviance term x * log(x / m) + m - x without cancellation for
+    x close to m (see Loader 2000). '''
+    with np.errstate(invalid='ignore', divide='ignore'):
+        direct = x * np.log(x / m) + m - x
+        v = (x - m) / (x + m)
+    near = np.abs(x - m) < 0.1 * (x + m)
+    v = np.where(near, v, 0.)
+    series = (x - m) * v
+    ej = 2 * x * v
+    for k in range(1, 12):  # |v| < 0.1: converged to double precision
+        ej = ej * v * v
+        series = series + ej / (2 * k + 1)
+    return np.where(near, series, direct)
+
+
+def _log_poisson_density(x, m):
+    ''' Logarithm of m ** x * exp(-m) / Gamma(x + 1) for x >= 0 (not
+    necessarily integer) and m >= 0, without the loss of digits of
+    xlogy(x, m) - m - gammaln(x + 1) for large x and m. '''
+    x = np.asarray(x, dtype='d')
+    xp = np.maximum(x, 1e-300)
+    with np.errstate(divide='ignore'):
+        value = (-_stirlerr(xp) - _bd0(xp, m)
+                 - 0.5 * np.log(2 * math.pi * xp))
+    return np.where(x > 0, value, -m)
+
+
+def _ncx2_window(y, df, mu, peak, width, tol, chunk):
+    ''' Sum of the series of ncx2_sf over the windows
+    [peak - width, peak + width] (1d arrays); returns the sums and
+    whether the terms at the window ends are negligible. '''
+    lo = np.maximum(np.floor(peak - width), 0.)
+    n_terms = int(np.max(np.ceil(peak + width) - lo)) + 1
+    q = scsp.chdtrc(df + 2 * lo, 2 * y)  # central tail at first term
+    total = np.zeros(y.shape)
+    first = last = None
+    for start in range(0, n_terms, chunk):
+        j = lo + np.arange(start, min(start + chunk, n_terms),
+                           dtype='d')[:, np.newaxis]
+        a = df / 2. + j
+        # Poisson weights and tail increments in logs: exact at the
+        # first term of the chunk, then by the recursions
+        # w_j = w_(j-1) * mu / j and incr_a = incr_(a-1) * y / a
+        with np.errstate(divide='ignore'):
+            lw = np.log(mu / j[1:])
+            li = np.log(y / a[1:])
+        lw = np.concatenate((np.zeros((1,) + mu.shape),
+                             np.add.accumulate(lw, axis=0)))
+        li = np.concatenate((np.zeros((1,) + y.shape),
+                             np.add.accumulate(li, axis=0)))
+        w = np.exp(lw + _log_poisson_density(j[0], mu))
+        incr = np.exp(li + _log_poisson_density(a[0], y))
+        csum = np.add.accumulate(incr, axis=0)
+        terms = w * (q + csum - incr)
+        total += np.add.reduce(terms, axis=0)
+        q = q + csum[-1]
+        if first is None:
+            first = terms[0]
+        last = terms[-1]
+    ok = ((first <= tol * total) | (lo == 0)) & (last <= tol * total)
+    return total, ok | (total == 0)
+
+
+def cx(K, gamma, nu, lambda_V, exact=True, backend='cdf'):
     ''' Complementary distribution function of non-central chi-squared density.
-    K: float (positive)
+    K: float (positive) or ndarray
         strike price
-    gamma: float (positive)
+    gamma: float (positive) or ndarray
         as defined in the GL96 model
-    nu: float (positive)
+    nu: float (positive) or ndarray
         degrees of freedom
-    lambda_V: float (positive)
+    lambda_V: float (positive) or ndarray
         non-centrality parameter
+    backend: string
+        'cdf': 1 - scipy.stats.ncx2.cdf (original implementation)
+        'sf': scipy.stats.ncx2.sf (no cancellation in the tail)
+        'special': 1 - scipy.special.chndtr; same values as 'cdf' but
+        without the generic distribution machinery of scipy.stats
+        'series': Poisson-weighted series (ncx2_sf); without
+        cancellation and with full relative precision far in the tail,
+        but slower than 'cdf' and 'special'
     '''
-    return 1 - scs.ncx2.cdf(gamma * K, nu, lambda_V)
+    if backend == 'cdf':
+        return 1 - scs.ncx2.cdf(gamma * K, nu, lambda_V)
+    elif backend == 'sf':
+        return scs.ncx2.sf(gamma * K, nu, lambda_V)
+    elif backend == 'special':
+        return 1 - scsp.chndtr(gamma * K, nu, lambda_V)
+    elif backend == 'series':
+        return ncx2_sf(gamma * K, nu, lambda_V)
+    raise ValueError("backend must be one of 'cdf', 'sf', 'special', "
+                     "'series'")
 
 
-def call_price(V0, kappa_V, theta_V, sigma_V, zeta_V, T, r, K):
+def gl96_factors(V0, kappa_V, theta_V, sigma_V, zeta_V, T):
+    ''' Auxiliary quantities of the GL96 pricing formulae. All inputs
+    may be floats or ndarray objects that broadcast against each other.
+
+    Returns
+    =======
+    alpha: kappa_V * theta_V
+    beta: kappa_V + zeta_V
+    gamma: scaling factor of the non-central chi-squared distribution
+    nu: degrees of freedom
+    lambda_V: non-centrality parameter
+    '''
+    alpha = kappa_V * theta_V
+    beta = kappa_V + zeta_V
+    gamma = 4 * beta / (sigma_V ** 2 * (1 - np.exp(-beta * T)))
+    nu = 4 * alpha / sigma_V ** 2
+    lambda_V = gamma * np.exp(-beta * T) * V0
+    return alpha, beta, gamma, nu, lambda_V
+
+
+def ncx2_tails(K, gamma, nu, lambda_V, shifts=(4, 2, 0), backend='cdf'):
+    ''' Evaluates cx for several shifts of the degrees of freedom in a
+    single (broadcasted) call; the result has one leading axis entry
+    per shift, i.e. shape (len(shifts),) + broadcast shape of inputs.
+    '''
+    shape = np.broadcast(K, gamma, nu, lambda_V).shape
+    dof = np.asarray(shifts, dtype='d').reshape((-1,) + (1,) * len(shape))
+    return cx(K, gamma, nu + dof, lambda_V, backend=backend)
+
+
+def call_price(V0, kappa_V, theta_V, sigma_V, zeta_V, T, r, K,
+               backend='cdf'):
     ''' Call option pricing formula in GL96 Model
+
+     All parameters may be given as floats or as ndarray objects which
+     are broadcast against each other (e.g. a vector of strikes).
      
      V0: float (positive)
         current volatility level
@@ -89,23 +273,193 @@ def call_price(V0, kappa_V, theta_V, sigma_V, zeta_V, T, r, K):
         risk-free short rate
      K: float(positive)
         strike price of the option
+     backend: string
+        evaluation method for the tail probabilities (see cx)
     '''
-    D = math.exp(-r * T)  # discount factor
+    D = np.exp(-r * T)  # discount factor
     
-    alpha = kappa_V * theta_V
-    beta = kappa_V + zeta_V
-    gamma = 4 * beta / (sigma_V ** 2 * (1 - math.exp(-beta * T)))
-    nu = 4 * alpha / sigma_V ** 2
-    lambda_V = gamma * math.exp(-beta * T) * V0
+    alpha, beta, gamma, nu, lambda_V = gl96_factors(V0, kappa_V, theta_V,
+                                                    sigma_V, zeta_V, T)
+    # the three tail probabilities in a single call
+    cx4, cx2, cx0 = ncx2_tails(K, gamma, nu, lambda_V, backend=backend)
 
     # the pricing formula
-    call = (D * math.exp(-beta * T) * V0 * cx(K, gamma, nu + 4, lambda_V)
-      + D * (alpha / beta) * (1 - math.exp(-beta * T))
-      * cx(K, gamma, nu + 2, lambda_V)
-      - D * K * cx(K, gamma, nu, lambda_V))
+    call = (D * np.exp(-beta * T) * V0 * cx4
+      + D * (alpha / beta) * (1 - np.exp(-beta * T)) * cx2
+      - D * K * cx0)
     return call
 
 
+def call_price_surface(V0, kappa_V, theta_V, sigma_V, zeta_V, T, r, K,
+                       backend='cdf'):
+    ''' Call option prices in GL96 Model for a whole set of maturities
+    and strikes in a single vectorized valuation.
+
+    T: array-like (positive)
+        times-to-maturity (length m)
+    K: array-like (positive)
+        strike prices (length n)
+
+    Returns
+    =======
+    call: ndarray
+        option values of shape (m, n); maturities along axis 0
+    '''
+    T = np.atleast_1d(np.asarray(T, dtype='d'))[:, np.newaxis]
+    K = np.atleast_1d(np.asarray(K, dtype='d'))[np.newaxis, :]
+    return call_price(V0, kappa_V, theta_V, sigma_V, zeta_V, T, r, K,
+                      backend=backend)
+
+
+def option_prices(V0, kappa_V, theta_V, sigma_V, zeta_V, T, r, K,
+                  backend='cdf'):
+    ''' Call and put option values in GL96 Model from a single set of
+    ncx2 tail evaluations; the put follows from put-call parity
+
+        P = C - exp(-r * T) * (F - K)
+
+    with F the futures price (the expectation of V_T, no tail
+    probabilities needed). Parameters as in call_price, vectorized over
+    strikes and maturities.
+
+    Returns
+    =======
+    call, put: float or ndarray
+        call and put option values
+    '''
+    call = call_price(V0, kappa_V, theta_V, sigma_V, zeta_V, T, r, K,
+                      backend=backend)
+    future = futures_price(V0, kappa_V, theta_V, zeta_V, T)
+    put = call - np.exp(-r * T) * (future - K)
+    return call, put
+
+
+def put_price(V0, kappa_V, theta_V, sigma_V, zeta_V, T, r, K,
+              backend='cdf'):
+    ''' Put option pricing formula in GL96 Model (via put-call parity).
+    Parameters as in call_price.
+    '''
+    return option_prices(V0, kappa_V, theta_V, sigma_V, zeta_V, T, r, K,
+                         backend=backend)[1]
+
+
+def call_greeks(V0, kappa_V, theta_V, sigma_V, zeta_V, T, r, K,
+                backend='cdf', h=1e-5):
+    ''' Call option value and sensitivities in GL96 Model.
+
+    Parameters as in call_price (floats or broadcastable ndarrays).
+    With x = gamma * K and X ~ ncx2(k, lambda_V), the undiscounted value is
+    H(k) = E[(X / gamma - K)^+]
+         = (k * cx(k + 2) + lambda_V * cx(k + 4)) / gamma - K * cx(k).
+    Derivatives w.r.t. lambda_V follow from the identity
+    dH(k) / dlambda_V = (H(k + 2) - H(k)) / 2, the derivative w.r.t.
+    gamma is available in closed form and the one w.r.t. the degrees of
+    freedom is a central difference of H with step h. All tail
+    probabilities (11 instead of 3 for the value) are evaluated in a
+    single batched call, sharing gamma, nu and lambda_V with the value.
+
+    h: float (positive)
+        step size for the derivative w.r.t. the degrees of freedom
+
+    Returns
+    =======
+    greeks: dict
+        'price': option value
+        'delta': derivative w.r.t. V0
+        'gamma': second derivative w.r.t. V0
+        'theta': time decay, i.e. -1 times derivative w.r.t. T
+        'kappa_V', 'theta_V', 'sigma_V': derivatives w.r.t. the
+        respective model parameter
+    '''
+    D = np.exp(-r * T)  # discount factor
+    E = np.exp(-(kappa_V + zeta_V) * T)
+    alpha, beta, gamma, nu, lambda_V = gl96_factors(V0, kappa_V, theta_V,
+                                                    sigma_V, zeta_V, T)
+    shifts = (0, 2, 4, 6, 8, -h, 2 - h, 4 - h, h, 2 + h, 4 + h)
+    q = ncx2_tails(K, gamma, nu, lambda_V, shifts=shifts, backend=backend)
+
+    def H(k, q0, q2, q4):
+        return (k * q2 + lambda_V * q4) / gamma - K * q0
+
+    H0 = H(nu, q[0], q[1], q[2])
+    H2 = H(nu + 2, q[1], q[2], q[3])
+    H4 = H(nu + 4, q[2], q[3], q[4])
+    H_lam = (H2 - H0) / 2
+    H_lamlam = (H4 - 2 * H2 + H0) / 4
+    H_gam = -(H0 + K * q[0]) / gamma
+    H_nu = (H(nu + h, q[8], q[9], q[10])
+            - H(nu - h, q[5], q[6], q[7])) / (2 * h)
+
+    # derivatives of gamma and lambda_V w.r.t. T and beta
+    dgam_dT = -gamma * beta * E / (1 - E)
+    dlam_dT = -lambda_V * beta / (1 - E)
+    dgam_db = gamma * (1 / beta - T * E / (1 - E))
+    dlam_db = lambda_V * (1 / beta - T / (1 - E))
+
+    price = D * H0
+    greeks = {
+        'price': price,
+        'delta': D * H_lam * gamma * E,
+        'gamma': D * H_lamlam * (gamma * E) ** 2,
+        'theta': r * price - D * (H_lam * dlam_dT + H_gam * dgam_dT),
+        'kappa_V': D * (H_nu * 4 * theta_V / sigma_V ** 2
+                        + H_gam * dgam_db + H_lam * dlam_db),
+        'theta_V': D * H_nu * 4 * kappa_V / sigma_V ** 2,
+        'sigma_V': -2 * D * (H_nu * nu + H_gam * gamma
+                             + H_lam * lambda_V) / sigma_V
+    }
+    return greeks
+
+
+#
+# Cached benchmark values for the assessment of Monte Carlo estimates
+#
+
+BENCHMARK_CACHE_SIZE = 4096  # maximum number of cached strike vectors
+
+
+@lru_cache(maxsize=BENCHMARK_CACHE_SIZE)
+def cached_call_prices(V0, kappa_V, theta_V, sigma_V, zeta_V, T, r, strikes,
+                       backend='cdf'):
+    ''' call_price for a tuple of strikes, memoized (LRU eviction) on all
+    model parameters, the maturity and the strikes. '''
+    values = call_price(V0, kappa_V, theta_V, sigma_V, zeta_V, T, r,
+                        np.array(strikes, dtype='d'), backend=backend)
+    values.flags.writeable = False  # shared between callers
+    return values
+
+
+def benchmark_call_prices(V0, kappa_V, theta_V, sigma_V, zeta_V, T, r, K,
+                          backend='cdf'):
+    ''' Analytical call option values in GL96 Model as benchmark for
+    Monte Carlo estimates; repeated requests for the same parameters,
+    maturity and strikes are served from a bounded LRU cache
+    (cached_call_prices.cache_info() gives hits and misses).
+    Parameters as in call_price (floats); K float or array of strikes.
+    '''
+    K = np.asarray(K, dtype='d')
+    values = cached_call_prices(float(V0), float(kappa_V), float(theta_V),
+                                float(sigma_V), float(zeta_V), float(T),
+                                float(r), tuple(K.ravel()), backend)
+    return values.reshape(K.shape)[()]
+
+
+def valuation_errors(estimate, V0, kappa_V, theta_V, sigma_V, zeta_V, T, r,
+                     K, backend='cdf'):
+    ''' Absolute and relative errors of Monte Carlo call estimates (e.g.
+    from call_estimator) w.r.t. the cached analytical benchmark values.
+
+    Returns
+    =======
+    benchmark, abs_error, rel_error: float or ndarray
+        analytical value(s), estimate - benchmark, and the error relative
+        to the benchmark (in decimals)
+    '''
+    benchmark = benchmark_call_prices(V0, kappa_V, theta_V, sigma_V, zeta_V,
+                                      T, r, K, backend)
+    abs_error = estimate - benchmark
+    return benchmark, abs_error, abs_error / benchmark
+
 
 #
 # Monte Carlo simulation (exact discretization)
@@ -116,7 +470,19 @@ dt = T / M  # time interval
 I = 50000  # number of MCS paths
 
 
-def generate_paths(x0, kappa, theta, sigma, T, M, I):
+def make_generator(seed=None, bit_generator='PCG64'):
+    ''' Returns an explicit numpy.random.Generator for the simulation.
+    seed: int, SeedSequence or None
+        seed of the bit generator (None: fresh entropy)
+    bit_generator: string
+        'PCG64', 'PCG64DXSM', 'Philox' or any other bit generator
+        available in numpy.random
+    '''
+    return np.random.Generator(getattr(np.random, bit_generator)(seed))
+
+
+def generate_paths(x0, kappa, theta, sigma, T, M, I, terminal_only=False,
+                   mo_match=False, anti_paths=False, rng=None):
     ''' Simulation of square-root diffusion with exact discretization
     x0: float (positive)
         starting value
@@ -132,31 +498,157 @@ def generate_paths(x0, kappa, theta, sigma, T, M, I):
         number of time intervals
     I: int
         number of simulation paths
+    terminal_only: bool
+        if True, only the values at T are returned (shape (I,)); the
+        process is stepped with a rolling state of size I such that memory
+        stays O(I); since the discretization is exact, M = 1 samples V_T
+        in a single step
+    mo_match: bool
+        moment matching of the standard normal rv (per time step);
+        only applies for d > 1 (no normal rv are used for d <= 1)
+    anti_paths: bool
+        antithetic standard normal rv (per time step); only applies
+        for d > 1
+    rng: numpy.random.Generator or None
+        random number generator, see make_generator (None: fresh
+        unseeded generator)
+
+    The time stepping works on three preallocated scratch vectors with
+    in-place ufuncs, i.e. a step allocates no new arrays (apart from the
+    Poisson draws in the case d <= 1).
     '''
-    x = np.zeros((M + 1, I), dtype=np.float)
-    x[0, :] = x0
-    ran = np.random.standard_normal((M + 1, I))
-      # matrix filled with standard normally distributed rv
+    if rng is None:
+        rng = make_generator()
+    dt = T / M  # time interval
     d = 4 * kappa * theta / sigma ** 2
+    if terminal_only:
+        x = np.empty(I, dtype='d')
+        x[:] = x0  # rolling state, updated in place
+    else:
+        x = np.empty((M + 1, I), dtype='d')
+        x[0, :] = x0
+    scratch = scratch_buffers(I)
+    for t in range(1, M + 1):
+        if terminal_only:
+            exact_step(x, x, kappa, sigma, d, dt, rng, scratch,
+                       mo_match, anti_paths)
+        else:
+            exact_step(x[t - 1], x[t], kappa, sigma, d, dt, rng, scratch,
+                       mo_match, anti_paths)
+    return x
+
+
+def generate_values_on_grid(x0, kappa, theta, sigma, maturities, M, I,
+                            preserve_steps=False, mo_match=False,
+                            anti_paths=False, rng=None):
+    ''' Simulation of square-root diffusion with exact discretization on
+    a single time grid containing all maturities; the values at the
+    maturities are read off along the way, i.e. one set of paths serves
+    all maturities and memory is O(len(maturities) * I).
+    Parameters as in generate_paths, in addition:
+
+    maturities: array-like (positive)
+        times-to-maturity at which the values are recorded
+    M: int
+        number of time intervals up to the longest maturity; with
+        preserve_steps=True, number of time intervals for every maturity
+    preserve_steps: bool
+        if True, the grid is the union of the equidistant grids with M
+        intervals for every maturity (each maturity is reached with its
+        own step size); otherwise the union of the equidistant grid up to
+        the longest maturity and the maturities themselves (the
+        discretization is exact, such that the values at the maturities
+        have the same distribution in both cases)
+
+    Returns
+    =======
+    x: ndarray
+        values at the maturities, shape (len(maturities), I)
+    '''
+    if rng is None:
+        rng = make_generator()
+    maturities = np.asarray(maturities, dtype='d')
+    if preserve_steps:
+        grid = np.concatenate([np.linspace(0, T, M + 1) for T in maturities])
+    else:
+        grid = np.concatenate((np.linspace(0, maturities.max(), M + 1),
+                               maturities))
+    # common grid points (up to rounding) are merged
+    grid = np.unique(np.round(np.concatenate(([0.], grid)), 12))
+    record = np.round(maturities, 12)
+    d = 4 * kappa * theta / sigma ** 2
+    x = np.empty((len(maturities), I), dtype='d')
+    xt = np.empty(I, dtype='d')
+    xt[:] = x0  # rolling state, updated in place
+    scratch = scratch_buffers(I)
+    for t in range(1, len(grid)):
+        exact_step(xt, xt, kappa, sigma, d, grid[t] - grid[t - 1], rng,
+                   scratch, mo_match, anti_paths)
+        for i in np.flatnonzero(record == grid[t]):
+            x[i] = xt
+    return x
+
+
+def scratch_buffers(I):
+    ''' Scratch buffers for exact_step: normal rv, chi-squared rv and
+    intermediate results. '''
+    return (np.empty(I, dtype='d'), np.empty(I, dtype='d'),
+            np.empty(I, dtype='d'))
+
+
+def exact_step(x_old, x_new, kappa, sigma, d, dt, rng, scratch,
+               mo_match=False, anti_paths=False):
+    ''' One step of the exact discretization of the square-root diffusion
+    from x_old to x_new (which may be the same array) using in-place
+    ufuncs on the scratch buffers only.
+
+    d: float
+        degrees of freedom 4 * kappa * theta / sigma ** 2
+    dt: float
+        length of the time step
+    scratch: tuple
+        three float arrays of the size of x_old, see scratch_buffers
+    mo_match, anti_paths: bool
+        variance reduction of the standard normal rv; only applies for
+        d > 1 (for d <= 1 the step uses Poisson and gamma rv only and
+        the flags are ignored)
+    '''
+    z, chi, buf = scratch
+    I = len(z)
     c = (sigma ** 2 * (1 - math.exp(-kappa * dt))) / (4 * kappa)
       # constant factor in the integrated process of x
+    f = math.exp(-kappa * dt) / c  # x_old * f is the non-centrality
     if d > 1:
-        for t in range(1, M + 1):
-            l = x[t - 1, :] * math.exp(-kappa * dt) / c
-              # non-centrality parameter
-            chi = np.random.chisquare(d - 1, I)
-              # matrix with chi-squared distributed rv
-            x[t, :] = c * ((ran[t] + np.sqrt(l)) ** 2 + chi)
+        if anti_paths is True:
+            half = (I + 1) // 2
+            rng.standard_normal(out=z[:half])
+            np.negative(z[:I - half], out=z[half:])
+        else:
+            rng.standard_normal(out=z)
+        if mo_match is True:
+            mean = z.sum() / I
+            std = math.sqrt(np.dot(z, z) / I - mean ** 2)
+            z /= std
+            z -= mean / std
+        np.multiply(x_old, f, out=buf)  # non-centrality parameter
+        np.sqrt(buf, out=buf)
+        buf += z
+        np.square(buf, out=buf)
+        rng.standard_gamma((d - 1) / 2., out=chi)
+          # chi-squared rv with d - 1 degrees of freedom (halved)
+        chi *= 2 * c
+        np.multiply(buf, c, out=x_new)
+        x_new += chi
     else:
-        for t in range(1, M + 1):
-            l = x[t - 1, :] * math.exp(-kappa * dt) / c
-            N = np.random.poisson(l / 2, I)
-            chi = np.random.chisquare(d + 2 * N, I)
-            x[t, :] = c * chi
-    return x
+        np.multiply(x_old, f / 2, out=buf)
+        buf[:] = rng.poisson(buf)  # Poisson rv N with mean l / 2
+        buf += d / 2.
+        rng.standard_gamma(buf, out=chi)
+          # chi-squared rv with d + 2 * N degrees of freedom (halved)
+        np.multiply(chi, 2 * c, out=x_new)
 
 
-def call_estimator(V0, kappa_V, theta_V, sigma_V, T, r, K, M, I):
+def call_estimator(V0, kappa_V, theta_V, sigma_V, T, r, K, M, I, rng=None):
     ''' Estimation of European call option price in GL96 Model
     via Monte Carlo simulation
     V0: float (positive)
@@ -177,6 +669,481 @@ def call_estimator(V0, kappa_V, theta_V, sigma_V, T, r, K, M, I):
         number of time intervals
     I: int
         number of simulation paths
+    rng: numpy.random.Generator or None
+        random number generator (see make_generator)
+    '''
+    VT = generate_paths(V0, kappa_V, theta_V, sigma_V, T, M, I,
+                        terminal_only=True, rng=rng)
+    return math.exp(-r * T) * np.sum(np.maximum(VT - K, 0)) / I
+
+
+def option_estimator(V0, kappa_V, theta_V, sigma_V, T, r, K, M, I,
+                     rng=None):
+    ''' Estimation of European call and put option prices in GL96 Model
+    via Monte Carlo simulation; both option types and all strikes are
+    valued with the same set of simulated paths.
+    Parameters as in call_estimator; K may be a float or an array of
+    strike prices.
+
+    Returns
+    =======
+    call, put: float or ndarray
+        estimated call and put values (one per strike)
+    '''
+    VT = generate_paths(V0, kappa_V, theta_V, sigma_V, T, M, I,
+                        terminal_only=True, rng=rng)
+    K = np.asarray(K, dtype='d')
+    strikes = K.reshape(-1, 1)
+    D = math.exp(-r * T)
+    call = D * np.sum(np.maximum(VT - strikes, 0), axis=1) / I
+    put = D * np.sum(np.maximum(strikes - VT, 0), axis=1) / I
+    return call.reshape(K.shape)[()], put.reshape(K.shape)[()]
+
+
+def put_estimator(V0, kappa_V, theta_V, sigma_V, T, r, K, M, I,
+                  rng=None):
+    ''' Estimation of European put option price in GL96 Model
+    via Monte Carlo simulation. Parameters as in call_estimator.
+    '''
+    VT = generate_paths(V0, kappa_V, theta_V, sigma_V, T, M, I,
+                        terminal_only=True, rng=rng)
+    return math.exp(-r * T) * np.sum(np.maximum(K - VT, 0)) / I
+
+
+#
+# Streaming Monte Carlo estimation with running statistics
+#
+
+class RunningStatistics(object):
+    ''' Running mean and variance (Welford/Chan) for a vector of
+    estimators, e.g. one per strike; samples are added batch-wise along
+    the last axis and partial statistics can be merged.
+
+    shape: tuple
+        shape of the estimator vector
+    '''
+
+    def __init__(self, shape=()):
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)  # sum of squared deviations
+
+    def merge(self, count, mean, m2):
+        ''' Merges partial statistics (count, mean, m2) into the totals. '''
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def update(self, samples):
+        ''' Adds a batch of samples (sample index along the last axis). '''
+        count = samples.shape[-1]
+        if count == 0:
+            return
+        mean = np.mean(samples, axis=-1)
+        m2 = np.sum((samples - mean[..., np.newaxis]) ** 2, axis=-1)
+        self.merge(count, mean, m2)
+
+    @property
+    def variance(self):
+        ''' Sample variance of the individual samples. '''
+        return self.m2 / max(self.count - 1, 1)
+
+    @property
+    def std_error(self):
+        ''' Standard error of the mean. '''
+        return np.sqrt(self.variance / max(self.count, 1))
+
+    def conf_int(self, level=0.95):
+        ''' Normal confidence interval for the mean. '''
+        z = scs.norm.ppf(0.5 + level / 2.)
+        return self.mean - z * self.std_error, self.mean + z * self.std_error
+
+
+def payoffs(VT, K, option='call'):
+    ''' Inner values at maturity, shape (number of strikes, paths).
+    VT: ndarray
+        simulated values at maturity
+    K: float or ndarray
+        strike price(s)
+    option: string
+        'call' or 'put'
+    '''
+    strikes = np.asarray(K, dtype='d').reshape(-1, 1)
+    if option == 'call':
+        return np.maximum(VT - strikes, 0)
+    elif option == 'put':
+        return np.maximum(strikes - VT, 0)
+    raise ValueError("option must be either 'call' or 'put'")
+
+
+def streaming_estimator(V0, kappa_V, theta_V, sigma_V, T, r, K, M, I,
+                        chunk_size=50000, se_target=None, level=0.95,
+                        option='call', mo_match=False, anti_paths=False,
+                        rng=None):
+    ''' Estimation of European option prices in GL96 Model via Monte Carlo
+    simulation with paths generated in chunks of fixed size; only
+    running sums are kept, memory is bounded by chunk_size.
+    Parameters as in call_estimator, in addition:
+
+    K: float or ndarray
+        strike price(s) of the option
+    I: int
+        maximum number of simulation paths
+    chunk_size: int
+        number of paths per chunk
+    se_target: float or None
+        stop early once the standard error of all estimates is below
+    level: float
+        confidence level of the confidence interval
+    option: string
+        'call' or 'put'
+    mo_match, anti_paths: bool
+        variance reduction (per chunk), see generate_paths
+    rng: numpy.random.Generator or None
+        random number generator (see make_generator)
+
+    Returns
+    =======
+    results: dict
+        'price': estimated option value(s)
+        'std_error': standard error(s) of the estimate(s)
+        'conf_int': tuple of lower and upper confidence bound(s)
+        'paths': number of paths actually simulated
+    '''
+    if rng is None:
+        rng = make_generator()
+    K = np.asarray(K, dtype='d')
+    D = math.exp(-r * T)
+    stats = RunningStatistics(K.size)
+    while stats.count < I:
+        paths = min(chunk_size, I - stats.count)
+        VT = generate_paths(V0, kappa_V, theta_V, sigma_V, T, M, paths,
+                            terminal_only=True, mo_match=mo_match,
+                            anti_paths=anti_paths, rng=rng)
+        stats.update(D * payoffs(VT, K, option))
+        if se_target is not None and np.all(stats.std_error <= se_target):
+            break
+    lower, upper = stats.conf_int(level)
+    return {'price': stats.mean.reshape(K.shape)[()],
+            'std_error': stats.std_error.reshape(K.shape)[()],
+            'conf_int': (lower.reshape(K.shape)[()],
+                         upper.reshape(K.shape)[()]),
+            'paths': stats.count}
+
+
+def adaptive_estimator(V0, kappa_V, theta_V, sigma_V, T, r, K, M,
+                       abs_tol=0.01, rel_tol=0.01, batch_size=25000,
+                       max_paths=10000000, level=0.95, option='call',
+                       mo_match=False, anti_paths=False, rng=None):
+    ''' Estimation of European option prices in GL96 Model via Monte Carlo
+    simulation with an adaptive number of paths: batches of paths are
+    added until for every strike the half-width of the confidence
+    interval is below abs_tol (absolute error in currency units, cf. PY1)
+    or below rel_tol times the estimate (relative error, cf. PY2), or
+    until max_paths paths are used. Parameters as in streaming_estimator,
+    in addition:
+
+    abs_tol: float
+        absolute error tolerance
+    rel_tol: float
+        relative error tolerance (in decimals)
+    batch_size: int
+        number of paths per batch
+    max_paths: int
+        budget of simulation paths
+
+    Returns
+    =======
+    results: dict
+        as streaming_estimator, plus 'converged': boolean flag(s) whether
+        the tolerance has been met for the respective strike
+    '''
+    if rng is None:
+        rng = make_generator()
+    K = np.asarray(K, dtype='d')
+    D = math.exp(-r * T)
+    z = scs.norm.ppf(0.5 + level / 2.)
+    stats = RunningStatistics(K.size)
+    while True:
+        paths = min(batch_size, max_paths - stats.count)
+        VT = generate_paths(V0, kappa_V, theta_V, sigma_V, T, M, paths,
+                            terminal_only=True, mo_match=mo_match,
+                            anti_paths=anti_paths, rng=rng)
+        stats.update(D * payoffs(VT, K, option))
+        half_width = z * stats.std_error
+        converged = ((half_width < abs_tol)
+                     | (half_width < rel_tol * np.abs(stats.mean)))
+        if np.all(converged) or stats.count >= max_paths:
+            break
+    lower, upper = stats.conf_int(level)
+    return {'price': stats.mean.reshape(K.shape)[()],
+            'std_error': stats.std_error.reshape(K.shape)[()],
+            'conf_int': (lower.reshape(K.shape)[()],
+                         upper.reshape(K.shape)[()]),
+            'paths': stats.count,
+            'converged': converged.reshape(K.shape)[()]}
+
+
+def cv_estimator(V0, kappa_V, theta_V, sigma_V, T, r, K, M, I,
+                 control_strikes=None, level=0.95, option='call',
+                 mo_match=False, anti_paths=False, rng=None):
+    ''' Estimation of European option prices in GL96 Model via Monte Carlo
+    simulation with control variates. The discounted payoffs are regressed
+    on the simulated V_T, whose expectation is the futures price, and
+    optionally on discounted call payoffs for further strikes, whose
+    expectations are given by call_price. The estimate is corrected by
+    the regression coefficients times the deviations of the controls from
+    their known expectations. Parameters as in streaming_estimator, in
+    addition:
+
+    control_strikes: array-like or None
+        strikes of calls used as additional control variates
+
+    Returns
+    =======
+    results: dict
+        as streaming_estimator, plus 'vr_factor': ratio of the payoff
+        variance to the residual variance after applying the controls
+        (the factor by which the number of paths can be reduced)
+    '''
+    K = np.asarray(K, dtype='d')
+    D = math.exp(-r * T)
+    VT = generate_paths(V0, kappa_V, theta_V, sigma_V, T, M, I,
+                        terminal_only=True, mo_match=mo_match,
+                        anti_paths=anti_paths, rng=rng)
+    Y = D * payoffs(VT, K, option)
+    X = VT[np.newaxis, :]
+    EX = np.array([futures_price(V0, kappa_V, theta_V, 0., T)])
+    if control_strikes is not None:
+        Kc = np.asarray(control_strikes, dtype='d')
+        X = np.concatenate((X, D * payoffs(VT, Kc, 'call')))
+        EX = np.concatenate((EX, np.atleast_1d(
+            call_price(V0, kappa_V, theta_V, sigma_V, 0., T, r, Kc))))
+    # regression coefficients from sample covariances
+    Xc = X - X.mean(axis=1)[:, np.newaxis]
+    Yc = Y - Y.mean(axis=1)[:, np.newaxis]
+    Sxx = np.dot(Xc, Xc.T) / (I - 1)
+    Sxy = np.dot(Xc, Yc.T) / (I - 1)
+    B = np.linalg.solve(Sxx, Sxy)
+    price = Y.mean(axis=1) - np.dot(B.T, X.mean(axis=1) - EX)
+    var_y = np.sum(Yc ** 2, axis=1) / (I - 1)
+    var_res = np.maximum(var_y - np.sum(Sxy * B, axis=0), 0.)
+    std_error = np.sqrt(var_res / I)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vr_factor = var_y / var_res
+    z = scs.norm.ppf(0.5 + level / 2.)
+    return {'price': price.reshape(K.shape)[()],
+            'std_error': std_error.reshape(K.shape)[()],
+            'conf_int': ((price - z * std_error).reshape(K.shape)[()],
+                         (price + z * std_error).reshape(K.shape)[()]),
+            'paths': I,
+            'vr_factor': vr_factor.reshape(K.shape)[()]}
+
+
+#
+# Parallel Monte Carlo estimation with independent random streams
+#
+
+def chunk_statistics(task):
+    ''' Simulates one chunk of paths and returns its partial statistics
+    (count, mean, m2) of the discounted payoffs; module-level function
+    such that it can be sent to worker processes.
+
+    task: tuple
+        (V0, kappa_V, theta_V, sigma_V, T, r, K, M, paths, option,
+        mo_match, anti_paths, seed_seq, bit_generator) with seed_seq the
+        numpy.random.SeedSequence of the chunk
+    '''
+    (V0, kappa_V, theta_V, sigma_V, T, r, K, M, paths, option,
+     mo_match, anti_paths, seed_seq, bit_generator) = task
+    rng = make_generator(seed_seq, bit_generator)
+      # the random stream depends on the chunk only, not on the worker
+    VT = generate_paths(V0, kappa_V, theta_V, sigma_V, T, M, paths,
+                        terminal_only=True, mo_match=mo_match,
+                        anti_paths=anti_paths, rng=rng)
+    stats = RunningStatistics(np.size(K))
+    stats.update(math.exp(-r * T) * payoffs(VT, K, option))
+    return stats.count, stats.mean, stats.m2
+
+
+def parallel_estimator(V0, kappa_V, theta_V, sigma_V, T, r, K, M, I,
+                       chunk_size=50000, seed=None, workers=None,
+                       level=0.95, option='call', mo_match=False,
+                       anti_paths=False, bit_generator='PCG64'):
+    ''' Estimation of European option prices in GL96 Model via Monte Carlo
+    simulation distributed over a pool of processes.
+
+    The I paths are split into chunks of chunk_size paths; chunk j is
+    simulated with the j-th child of numpy.random.SeedSequence(seed).
+    Partial statistics are reduced in chunk order such that the results
+    are bit-reproducible for a given seed, independent of the number of
+    workers. Parameters as in streaming_estimator, in addition:
+
+    seed: int or None
+        root seed of the SeedSequence (None: fresh entropy)
+    workers: int or None
+        number of worker processes (None: number of CPUs; 1: no pool)
+    bit_generator: string
+        bit generator of the chunk streams (see make_generator)
+
+    Returns
+    =======
+    results: dict
+        as streaming_estimator, plus 'seed' (entropy of the root
+        SeedSequence to reproduce the run)
+    '''
+    K = np.asarray(K, dtype='d')
+    root = np.random.SeedSequence(seed)
+    n_chunks = int(math.ceil(float(I) / chunk_size))
+    tasks = [(V0, kappa_V, theta_V, sigma_V, T, r, K, M,
+              min(chunk_size, I - j * chunk_size), option, mo_match,
+              anti_paths, seed_seq, bit_generator)
+             for j, seed_seq in enumerate(root.spawn(n_chunks))]
+    stats = RunningStatistics(K.size)
+    if workers == 1:
+        for partial in map(chunk_statistics, tasks):
+            stats.merge(*partial)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for partial in pool.map(chunk_statistics, tasks):
+                stats.merge(*partial)  # in chunk order
+    lower, upper = stats.conf_int(level)
+    return {'price': stats.mean.reshape(K.shape)[()],
+            'std_error': stats.std_error.reshape(K.shape)[()],
+            'conf_int': (lower.reshape(K.shape)[()],
+                         upper.reshape(K.shape)[()]),
+            'paths': stats.count,
+            'seed': root.entropy}
+
+
+#
+# Quasi-Monte Carlo simulation (scrambled Sobol sequences)
+#
+
+def brownian_bridge(z, T):
+    ''' Transforms standard normal rv, ordered by importance along axis 1,
+    into standard normal increments of a Brownian motion on an equidistant
+    grid via the Brownian bridge construction: the first column fixes
+    W(T), the following ones the midpoints of ever finer subintervals.
+    z: ndarray
+        standard normal rv of shape (I, M)
+    T: float (positive)
+        time horizon
+    '''
+    I, M = z.shape
+    dt = T / M
+    W = np.zeros((I, M + 1))
+    W[:, M] = math.sqrt(T) * z[:, 0]
+    intervals = [(0, M)]
+    k = 1  # next column of z to be used
+    while intervals:
+        left, right = intervals.pop(0)
+        if right - left < 2:
+            continue
+        mid = (left + right) // 2
+        wl = float(right - mid) / (right - left)  # weight of left end point
+        sd = math.sqrt((mid - left) * (right - mid) * dt / (right - left))
+        W[:, mid] = wl * W[:, left] + (1 - wl) * W[:, right] + sd * z[:, k]
+        k += 1
+        intervals += [(left, mid), (mid, right)]
+    return np.diff(W, axis=1) / math.sqrt(dt)
+
+
+def generate_paths_qmc(x0, kappa, theta, sigma, T, M, I, terminal_only=False,
+                       bridge=True, seed=None, block_size=8192):
+    ''' Simulation of square-root diffusion with exact discretization
+    driven by a scrambled Sobol sequence of dimension 2 * M; all rv are
+    obtained by inverse transforms (normal, Poisson, chi-squared).
+    The Sobol points are drawn and transformed in consecutive blocks of
+    paths, i.e. the scratch memory is of order block_size * M instead of
+    I * M; the results do not depend on block_size.
+    Parameters as in generate_paths, in addition:
+
+    I: int
+        number of simulation paths (a power of 2 preserves the balance
+        properties of the Sobol sequence)
+    bridge: bool
+        if True, the normal rv are assigned to the time steps via the
+        Brownian bridge construction such that the first (best
+        distributed) Sobol dimensions determine the coarse path shape
+    seed: int, numpy.random.Generator or None
+        seed for the scrambling of the Sobol sequence
+    block_size: int
+        number of paths simulated at a time
+    '''
+    dt = T / M  # time interval
+    d = 4 * kappa * theta / sigma ** 2
+    c = (sigma ** 2 * (1 - math.exp(-kappa * dt))) / (4 * kappa)
+      # constant factor in the integrated process of x
+    sobol = scs.qmc.Sobol(d=2 * M, scramble=True, seed=seed)
+    if terminal_only:
+        x = np.empty(I, dtype='d')
+    else:
+        x = np.empty((M + 1, I), dtype='d')
+    for start in range(0, I, block_size):
+        n = min(block_size, I - start)
+        u = sobol.random(n)  # next n points of the sequence
+        if d > 1:
+            z = scsp.ndtri(u[:, :M])
+            if bridge:
+                z = brownian_bridge(z, T)
+        xt = np.empty(n, dtype='d')
+        xt[:] = x0
+        if not terminal_only:
+            x[0, start:start + n] = xt
+        for t in range(1, M + 1):
+            l = xt * math.exp(-kappa * dt) / c
+              # non-centrality parameter
+            if d > 1:
+                chi = 2 * scsp.gammaincinv((d - 1) / 2., u[:, M + t - 1])
+                xt = c * ((z[:, t - 1] + np.sqrt(l)) ** 2 + chi)
+            else:
+                N = scs.poisson.ppf(u[:, t - 1], l / 2)
+                chi = 2 * scsp.gammaincinv(d / 2. + N, u[:, M + t - 1])
+                xt = c * chi
+            if not terminal_only:
+                x[t, start:start + n] = xt
+        if terminal_only:
+            x[start:start + n] = xt
+    return x
+
+
+def qmc_estimator(V0, kappa_V, theta_V, sigma_V, T, r, K, M, I,
+                  replications=8, bridge=True, seed=None, level=0.95,
+                  option='call'):
+    ''' Estimation of European option prices in GL96 Model via randomized
+    quasi-Monte Carlo simulation: the estimate is the mean over
+    independently scrambled Sobol sequences with I paths each, the
+    standard error is derived from the spread between replications.
+    Parameters as in streaming_estimator, in addition:
+
+    replications: int
+        number of independent scramblings
+    bridge: bool
+        Brownian bridge construction (see generate_paths_qmc)
+    seed: int or None
+        seed for the scramblings
+
+    Returns
+    =======
+    results: dict
+        as streaming_estimator
     '''
-    V = generate_paths(V0, kappa_V, theta_V, sigma_V, T, M, I)
-    return math.exp(-r * T) * np.sum(np.maximum(V[-1] - K, 0)) / I
+    K = np.asarray(K, dtype='d')
+    rng = make_generator(seed)
+    stats = RunningStatistics(K.size)
+    for _ in range(replications):
+        VT = generate_paths_qmc(V0, kappa_V, theta_V, sigma_V, T, M, I,
+                                terminal_only=True, bridge=bridge, seed=rng)
+        value = math.exp(-r * T) * np.mean(payoffs(VT, K, option), axis=1)
+        stats.update(value[:, np.newaxis])
+    lower, upper = stats.conf_int(level)
+    return {'price': stats.mean.reshape(K.shape)[()],
+            'std_error': stats.std_error.reshape(K.shape)[()],
+            'conf_int': (lower.reshape(K.shape)[()],
+                         upper.reshape(K.shape)[()]),
+            'paths': I * replications}
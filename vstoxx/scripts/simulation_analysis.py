@@ -12,8 +12,17 @@ import numpy as np
 from datetime import datetime
 import time
 import math
-from pricing_formulae import call_price
+import json
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pricing_formulae import (benchmark_call_prices, generate_paths,
+                              generate_paths_qmc, generate_values_on_grid,
+                              make_generator)
 from simulation_results import *
+from monitoring import Metrics, Progress, get_logger, log_event
+
+logger = get_logger('simulation_analysis')
 
 # Model Parameters
 V0 = 20  # initial volatility
@@ -25,12 +34,24 @@ r = 0.01  # risk-free short rate
 
 # General Simulation Parameters
 write = True
-var_red = [(False, False), (False, True), (True, False), (True, True)]
+var_red = [(False, False, False), (False, True, False), (True, False, False),
+           (True, True, False), (False, False, True)]
     # 1st = mo_match -- random number correction (std + mean + drift)
     # 2nd = anti_paths -- antithetic paths for variance reduction
+    # 3rd = qmc -- scrambled Sobol sequence with Brownian bridge
+shared_paths = True
+    # simulate once per run on a grid containing all maturities
+    # (not for qmc) instead of once per maturity; time steps are then
+    # counted up to the longest maturity (marked G in the name)
+preserve_steps = False
+    # shared paths: keep the equidistant grid of every maturity, i.e.
+    # time steps per maturity (marked GP in the name)
 steps_list = [25, 50, 75, 100]  # Time Steps
 paths_list = [2500, 50000, 75000, 100000, 125000, 150000]
     # number of paths per valuation
+qmc_paths_list = [2048, 8192, 16384, 32768, 65536, 131072]
+    # number of paths per valuation for qmc (powers of 2 to preserve
+    # the balance properties of the Sobol sequence)
 SEED = 100000  # seed value
 runs = 3  # number of simulation runs
 PY1 = 0.010  # performance yardstick 1: abs. error in currency units
@@ -39,146 +60,275 @@ maturity_list = [1.0 / 12 , 1.0 / 4, 1.0 / 2, 1.0]  # maturity List
 strike_list = [15.0, 17.5, 20.0, 22.5, 25.0]  # strike List
 
 #
-# Simulation Function for GL96 Volatility Process
+# Study Configurations
 #
 
 
-def generate_paths(x0, kappa, theta, sigma, T, steps, paths):
-    ''' Simulation of square-root diffusion with exact discretization
-    x0: float (positive)
-        starting value
-    kappa: float (positive)
-        mean-reversion factor
-    theta: float (positive)
-        long-run mean
-    sigma: float (positive)
-        volatility (of volatility)
-    T: float (positive)
-        time-to-maturity
-    steps: int
-        number of time intervals
-    paths: int
-        number of simulation paths
-    '''
-    x = np.zeros((steps + 1, paths), dtype=np.float)
-    x[0, :] = x0
-    ran = randoms(steps, paths)
-      # matrix filled with standard normally distributed rv
-    d = 4 * kappa * theta / sigma ** 2
-    c = (sigma ** 2 * (1 - math.exp(-kappa * dt))) / (4 * kappa)
-      # constant factor in the integrated process of x
-    if d > 1:
-        for t in range(1, steps + 1):
-            l = x[t - 1, :] * math.exp(-kappa * dt) / c
-              # non-centrality parameter
-            chi = np.random.chisquare(d - 1, paths)
-              # matrix with chi-squared distributed rv
-            x[t, :] = c * ((ran[t] + np.sqrt(l)) ** 2 + chi)
-    else:
-        for t in range(1, steps + 1):
-            l = x[t - 1, :] * math.exp(-kappa * dt) / c
-            N = np.random.poisson(l / 2, paths)
-            chi = np.random.chisquare(d + 2 * N, paths)
-            x[t, :] = c * chi
-    return x
-
-
-def randoms(steps, paths):
-    ''' Function to generate pseudo-random numbers with variance reduction.
-    steps: int
-        number of discrete time intervals
-    paths: int
-        number of simulated paths
-    '''
-    if anti_paths is True:
-        rand_ = np.random.standard_normal((steps + 1, paths / 2))
-        rand = np.concatenate((rand_, -rand_), 1)
-    else:
-        rand = np.random.standard_normal((steps + 1, paths))
-    if mo_match is True:
-        rand = rand / np.std(rand)
-        rand = rand - np.mean(rand)
-    return rand
+def simulation_name(runs, steps, paths, mo_match, anti_paths, qmc, PY1, PY2,
+                    shared=False, preserve=False):
+    ''' Name of a simulation setup (unique per configuration); shared
+    and preserve are the grid mode (see shared_paths, preserve_steps). '''
+    return ('Call_' + str(runs) + '_'
+            + str(steps) + '_' + str(paths // 1000)
+            + '_' + str(mo_match)[0] + str(anti_paths)[0]
+            + ('Q' if qmc else '') + ('G' if shared else '')
+            + ('P' if shared and preserve else '') +
+            '_' + str(PY1 * 100) + '_' + str(PY2 * 100))
+
+
+def task_key(task):
+    ''' Key of the full parameters of a task (hex digest of the task
+    dict); configurations are only taken as completed if the key of the
+    stored results matches. '''
+    return hashlib.sha1(json.dumps(task, sort_keys=True,
+                                   default=str).encode()).hexdigest()
+
+
+def study_tasks():
+    ''' Returns the var_red x steps x paths grid of the study as list of
+    independent tasks; every task carries all parameters it needs
+    (qmc configurations use qmc_paths_list instead of paths_list). '''
+    tasks = []
+    for mo_match, anti_paths, qmc in var_red:  # variance reduction
+        for steps in steps_list:  # number of time steps
+            for paths in (qmc_paths_list if qmc else paths_list):
+                  # number of paths
+                shared = shared_paths and not qmc
+                tasks.append({
+                    'name': simulation_name(runs, steps, paths, mo_match,
+                                            anti_paths, qmc, PY1, PY2,
+                                            shared, preserve_steps),
+                    'V0': V0, 'kappa_V': kappa_V, 'theta_V': theta_V,
+                    'sigma_V': sigma_V, 'zeta_V': zeta_V, 'r': r,
+                    'mo_match': mo_match, 'anti_paths': anti_paths,
+                    'qmc': qmc, 'steps': steps, 'paths': paths,
+                    'shared_paths': shared,
+                    'preserve_steps': shared and preserve_steps,
+                    'seed': SEED, 'runs': runs, 'PY1': PY1, 'PY2': PY2,
+                    'maturity_list': maturity_list,
+                    'strike_list': strike_list})
+    return tasks
+
 
 #
 # Valuation
 #
-t0 = time.time()
-sim_results = pd.DataFrame()
-
-for vr in var_red:  # variance reduction techniques
-    mo_match, anti_paths = vr
-    for steps in steps_list:  # number of time steps
-        for paths in paths_list:  # number of paths
-            t1 = time.time()
-            d1 = datetime.now() 
-            abs_errors = []
-            rel_errors = []
-            l = 0.0
-            errors = 0
-            # name of the simulation Setup
-            name = ('Call_' + str(runs) + '_'
-                    + str(steps) + '_' + str(paths / 1000)
-                    + '_' + str(mo_match)[0] + str(anti_paths)[0] +
-                    '_' + str(PY1 * 100) + '_' + str(PY2 * 100))
-            np.random.seed(SEED)  # RNG seed value
-            for run in range(runs):  # Simulation Runs
-                print "\nSimulation Run %d of %d" % (run + 1, runs)
-                print "----------------------------------------------------"
-                print ("Elapsed Time in Minutes %8.2f"
-                        % ((time.time() - t0) / 60))
-                print "----------------------------------------------------"
-                z = 0
-                for T in maturity_list:  # Time-to-Maturity
-                    dt = T / steps  # time interval in year fractions
-                    V = generate_paths(V0, kappa_V, theta_V, sigma_V, T, steps, paths)
-                        # volatility process paths
-                    print "\n  Results for Time-to-Maturity %6.3f" % T
-                    print "  -----------------------------------------"
-                    for K in strike_list:  # Strikes
-                        h = np.maximum(V[-1] - K, 0)  # inner value matrix
-                        ## MCS Estimator
-                        call_estimate = math.exp(-r * T) * np.sum(h) / paths * 100
-                        ## BSM Analytical Value
-                        call_value = call_price(V0, kappa_V, theta_V, sigma_V,
-                                        zeta_V, T, r, K) * 100
-                        ## Errors
-                        diff = call_estimate - call_value
-                        rdiff = diff / call_value
-                        abs_errors.append(diff)
-                        rel_errors.append(rdiff * 100)
-                        ## Output
-                        br = "    ----------------------------------"
-                        print "\n  Results for Strike %4.2f\n" % K
-                        print ("    European Op. Value MCS    %8.4f" %  
-                                    call_estimate)
-                        print ("    European Op. Value Closed %8.4f" % 
-                                    call_value)
-                        print "    Valuation Error (abs)     %8.4f" % diff
-                        print "    Valuation Error (rel)     %8.4f" % rdiff
-                        if abs(diff) < PY1 or abs(diff) / call_value < PY2:
-                                print "      Accuracy ok!\n" + br
-                                CORR = True
-                        else:
-                                print "      Accuracy NOT ok!\n" + br
-                                CORR = False
-                                errors = errors + 1
-                        print "    %d Errors, %d Values, %.1f Min." \
-                                % (errors, len(abs_errors),
-                            float((time.time() - t1) / 60))
-                        print ("    %d Time Intervals, %d Paths"
-                                % (steps, paths))
-                        z = z + 1
-                        l = l + 1
-
-            t2 = time.time()
-            d2 = datetime.now()
-            if write is True:  # Append Simulation Results
-                sim_results = write_results(sim_results, name, SEED,
-                        runs, steps, paths, mo_match, anti_paths,
-                        l, PY1, PY2, errors,
-                        float(errors) / l, np.array(abs_errors),
-                        np.array(rel_errors), t2 - t1, (t2 - t1) / 60, d1, d2)
-
-if write is True:  # write/append DataFrame to HDFStore
-    write_to_database(sim_results)
\ No newline at end of file
+
+
+def run_configuration(task):
+    ''' Values all options of the study for one configuration (all runs,
+    maturities and strikes). Per-option results are emitted as DEBUG
+    records, a summary with counters and timings as INFO record of the
+    logger (silent unless enabled, see monitoring).
+
+    task: dict
+        configuration as generated by study_tasks
+
+    Returns
+    =======
+    result: dict
+        aggregate results (one row of the results table, see result_row)
+    options: pandas.DataFrame
+        results per option valuation (see option_table)
+    '''
+    V0, kappa_V, theta_V = task['V0'], task['kappa_V'], task['theta_V']
+    sigma_V, zeta_V, r = task['sigma_V'], task['zeta_V'], task['r']
+    steps, paths, runs = task['steps'], task['paths'], task['runs']
+    PY1, PY2 = task['PY1'], task['PY2']
+    metrics = Metrics()
+    t1 = time.time()
+    d1 = datetime.now()
+    abs_errors = []
+    rel_errors = []
+    l = 0.0
+    errors = 0
+    n = runs * len(task['maturity_list']) * len(task['strike_list'])
+    raw = dict((name, np.empty(n)) for name in ('run', 'maturity',
+                'strike', 'estimate', 'benchmark', 'std_error', 'time'))
+    j = 0  # index of option valuation
+    debug = logger.isEnabledFor(logging.DEBUG)  # per-option records
+    rng = make_generator(task['seed'])  # RNG with seed value
+    for run in range(runs):  # Simulation Runs
+        shared = task['shared_paths'] is True and task['qmc'] is not True
+          # not for qmc (see study_tasks)
+        tg = 0.0  # share of the grid simulation per maturity
+        if shared:
+            t0 = time.time()
+            with metrics.timer('simulation'):
+                values = generate_values_on_grid(V0, kappa_V, theta_V,
+                        sigma_V, task['maturity_list'], steps, paths,
+                        preserve_steps=task['preserve_steps'],
+                        mo_match=task['mo_match'],
+                        anti_paths=task['anti_paths'], rng=rng)
+                # volatility process values at all maturities
+            tg = (time.time() - t0) / len(task['maturity_list'])
+        for m, T in enumerate(task['maturity_list']):  # Time-to-Maturity
+            tm = time.time()
+            with metrics.timer('simulation'):
+                if shared:
+                    VT = values[m]
+                elif task['qmc'] is True:
+                    VT = generate_paths_qmc(V0, kappa_V, theta_V, sigma_V,
+                            T, steps, paths, terminal_only=True, seed=rng)
+                else:
+                    VT = generate_paths(V0, kappa_V, theta_V, sigma_V, T,
+                            steps, paths, terminal_only=True,
+                            mo_match=task['mo_match'],
+                            anti_paths=task['anti_paths'], rng=rng)
+                    # volatility process values at maturity
+            ts = (tg + time.time() - tm) / len(task['strike_list'])
+                # simulation time per option: grid share (shared paths)
+                # plus the simulation for this maturity
+            with metrics.timer('valuation'):
+                call_values = benchmark_call_prices(V0, kappa_V, theta_V,
+                                sigma_V, zeta_V, T, r,
+                                task['strike_list']) * 100
+                    # analytical values for all strikes (cached)
+                for k, K in enumerate(task['strike_list']):  # Strikes
+                    tv = time.time()
+                    h = np.maximum(VT - K, 0)  # inner value vector
+                    ## MCS Estimator
+                    call_estimate = (math.exp(-r * T) * np.sum(h)
+                                     / paths * 100)
+                    std_error = (math.exp(-r * T) * np.std(h, ddof=1)
+                                 / math.sqrt(paths) * 100)
+                    ## BSM Analytical Value
+                    call_value = call_values[k]
+                    ## Errors
+                    diff = call_estimate - call_value
+                    rdiff = diff / call_value
+                    abs_errors.append(diff)
+                    rel_errors.append(rdiff * 100)
+                    accurate = abs(diff) < PY1 or abs(diff) / call_value < PY2
+                    if not accurate:
+                        errors = errors + 1
+                    metrics.incr('options')
+                    metrics.incr('errors', int(not accurate))
+                    ## Output
+                    if debug:
+                        log_event(logger, logging.DEBUG, 'option_value',
+                                  sim_name=task['name'], run=run,
+                                  maturity=T, strike=K,
+                                  estimate=call_estimate,
+                                  benchmark=call_value, abs_error=diff,
+                                  rel_error=rdiff, accurate=accurate)
+                    ## Raw Results
+                    raw['run'][j], raw['maturity'][j] = run, T
+                    raw['strike'][j], raw['estimate'][j] = K, call_estimate
+                    raw['benchmark'][j] = call_value
+                    raw['std_error'][j] = std_error
+                    raw['time'][j] = ts + time.time() - tv
+                    j += 1
+                    l = l + 1
+    t2 = time.time()
+    d2 = datetime.now()
+    key = task_key(task)  # identifies the parameters in the store
+    log_event(logger, logging.INFO, 'configuration_done',
+              sim_name=task['name'], steps=steps, paths=paths,
+              error_ratio=float(errors) / l, **metrics.as_dict())
+    result = result_row(task['name'], task['seed'],
+                runs, steps, paths, task['mo_match'], task['anti_paths'],
+                l, PY1, PY2, errors,
+                float(errors) / l, np.array(abs_errors),
+                np.array(rel_errors), t2 - t1, (t2 - t1) / 60, d1, d2,
+                task['qmc'], shared, shared and task['preserve_steps'], key)
+    options = option_table(task['name'], task['seed'], raw['run'],
+                           raw['maturity'], raw['strike'], raw['estimate'],
+                           raw['benchmark'], raw['std_error'], raw['time'],
+                           key)
+    return result, options
+
+
+def completed_configurations(filename=filename):
+    ''' Returns the set of task keys (see task_key) already stored. '''
+    try:
+        h5 = pd.HDFStore(filename, 'r')
+    except (IOError, OSError):
+        return set()
+    try:
+        if 'task_key' not in (h5.get_storer('sim_results').data_columns
+                              if 'sim_results' in h5 else []):
+            return set()  # no results or written by earlier versions
+        done = h5.select_column('sim_results', 'task_key')
+    finally:
+        h5.close()
+    return set(done)
+
+
+def run_study(tasks=None, workers=None, write=write, resume=True,
+              filename=filename, batch_size=10, progress=False):
+    ''' Runs the simulation study with the configurations distributed
+    over a pool of processes. Completed configurations are appended to
+    the results store in batches (checkpoints); with resume=True,
+    configurations already present in the store with the same parameters
+    (see task_key) are skipped, such that an interrupted study continues
+    where it stopped.
+
+    tasks: list or None
+        configurations (None: study_tasks())
+    workers: int or None
+        number of worker processes (None: number of CPUs; 1: no pool)
+    write: bool
+        whether to store results in the HDFStore
+    resume: bool
+        skip configurations already present in the HDFStore (per-option
+        results of configurations not completed are removed first)
+    filename: string
+        HDFStore for the results
+    batch_size: int
+        number of configurations per write (at most one batch is lost
+        if the study is interrupted)
+    progress: bool
+        show a (rate-limited) progress bar on sys.stderr
+
+    Returns
+    =======
+    sim_results: pandas.DataFrame
+        results of the configurations run
+    '''
+    if tasks is None:
+        tasks = study_tasks()
+    if write is True:
+        index_results(filename)  # tables of earlier versions
+    if write is True and resume is True:
+        remove_orphan_options(filename)  # from an interrupted write
+        done = completed_configurations(filename)
+        n = len(tasks)
+        tasks = [task for task in tasks if task_key(task) not in done]
+        log_event(logger, logging.INFO, 'study_resume',
+                  skipped=n - len(tasks), remaining=len(tasks))
+    results = []
+    bar = Progress(len(tasks), enabled=progress)
+    writer = None
+    if write is True:
+        writer = ResultsWriter(filename, batch_size=batch_size)
+    t0 = time.time()
+
+    def store(output):
+        result, options = output
+        results.append(result)
+        if writer is not None:  # checkpoint: buffer row, write batch
+            writer.append(result, options)
+        bar.update()
+
+    try:
+        if workers == 1:
+            for task in tasks:
+                store(run_configuration(task))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(run_configuration, task)
+                           for task in tasks]
+                for future in as_completed(futures):
+                    store(future.result())
+    finally:
+        if writer is not None:
+            writer.flush()
+    log_event(logger, logging.INFO, 'study_done',
+              configurations=len(results), seconds=time.time() - t0)
+    return pd.DataFrame(results, columns=[name for name, _
+                                          in RESULT_COLUMNS])
+
+
+if __name__ == '__main__':
+    sim_results = run_study(progress=True)
@@ -18,18 +18,65 @@ import matplotlib.pyplot as plt
 filename = "./data/simulation_results.h5"
 
 
-def write_results(sim_results, name, SEED, runs, steps, paths, mo_match,
-                  anti_paths, l, PY1, PY2, errors, error_ratio,
-                  abs_errors, rel_errors, t1, t2, d1, d2):
-    ''' Appends simulation results to pandas.DataFrame df. '''
-    results = {
+# Columns (and dtypes) of the sim_results table
+RESULT_COLUMNS = [('sim_name', object), ('seed', 'i8'),
+                  ('task_key', object), ('runs', 'i8'), ('time_steps', 'i8'), ('paths', 'i8'), ('mo_match', '?'),
+                  ('anti_paths', '?'), ('qmc', '?'), ('shared_paths', '?'),
+                  ('preserve_steps', '?'), ('opt_prices', 'f8'),
+                  ('abs_tol', 'f8'), ('rel_tol', 'f8'), ('errors', 'i8'),
+                  ('error_ratio', 'f8'), ('av_val_err', 'f8'),
+                  ('ab_val_err', 'f8'), ('time_sec', 'f8'),
+                  ('time_min', 'f8'), ('time_opt', 'f8'),
+                  ('start_date', 'M8[ns]'), ('end_date', 'M8[ns]')]
+
+# Flags of the sim_results table encoded in sim_name (for tables written
+# before the columns existed)
+name_flags = [('qmc', '_[TF]{2}Q'), ('shared_paths', '_[TF]{2}Q?G'),
+              ('preserve_steps', '_[TF]{2}Q?GP')]
+
+# Indexed columns of the sim_results table (usable in where queries)
+DATA_COLUMNS = ['sim_name', 'task_key', 'time_steps', 'paths', 'mo_match',
+                'anti_paths', 'qmc', 'shared_paths', 'preserve_steps']
+
+# Columns (and dtypes) of the option_results table (one row per option
+# valuation) and its indexed columns
+OPTION_COLUMNS = [('sim_name', object), ('seed', 'i8'), ('task_key', object),
+                  ('run', 'i8'), ('maturity', 'f8'), ('strike', 'f8'),
+                  ('estimate', 'f8'), ('benchmark', 'f8'),
+                  ('std_error', 'f8'), ('time_sec', 'f8')]
+OPTION_DATA_COLUMNS = ['sim_name', 'seed', 'task_key', 'run', 'maturity',
+                       'strike']
+
+# Sizes of the string columns (task_key: hex digest of the task, see
+# task_key in simulation_analysis; empty for rows of earlier versions)
+min_itemsize = {'sim_name': 30, 'task_key': 40}
+
+# Compression of the option_results table (chunked PyTables table)
+complib = 'blosc'
+complevel = 5
+
+
+def result_row(name, SEED, runs, steps, paths, mo_match, anti_paths, l,
+               PY1, PY2, errors, error_ratio, abs_errors, rel_errors,
+               t1, t2, d1, d2, qmc=False, shared_paths=False,
+               preserve_steps=False, task_key=''):
+    ''' Returns the simulation results of a configuration as dict
+    (one row of the sim_results table; qmc: Sobol paths; shared_paths,
+    preserve_steps: grid mode, with shared_paths steps counts the time
+    intervals up to the longest maturity unless preserve_steps;
+    task_key: key of the full parameters of the configuration). '''
+    return {
     'sim_name': name,
     'seed': SEED,
+    'task_key': task_key,
     'runs': runs,
     'time_steps': steps,
     'paths': paths,
     'mo_match': mo_match,
     'anti_paths': anti_paths,
+    'qmc': qmc,
+    'shared_paths': shared_paths,
+    'preserve_steps': preserve_steps,
     'opt_prices': l,
     'abs_tol': PY1,
     'rel_tol': PY2,
@@ -43,71 +90,351 @@ def write_results(sim_results, name, SEED, runs, steps, paths, mo_match,
     'start_date': d1,
     'end_date': d2
     }
+
+
+def write_results(sim_results, name, SEED, runs, steps, paths, mo_match,
+                  anti_paths, l, PY1, PY2, errors, error_ratio,
+                  abs_errors, rel_errors, t1, t2, d1, d2, qmc=False,
+                  shared_paths=False, preserve_steps=False, task_key=''):
+    ''' Appends simulation results to pandas.DataFrame df (copies df;
+    use ResultsWriter to collect the rows of a whole study). '''
+    results = result_row(name, SEED, runs, steps, paths, mo_match,
+                         anti_paths, l, PY1, PY2, errors, error_ratio,
+                         abs_errors, rel_errors, t1, t2, d1, d2, qmc,
+                         shared_paths, preserve_steps, task_key)
     df = pd.concat([sim_results, pd.DataFrame([results])], ignore_index=True)
     return df
 
 
-def write_to_database(sim_results):
+def option_table(name, SEED, run, maturity, strike, estimate, benchmark,
+                 std_error, time_sec, task_key=''):
+    ''' Returns the valuation results of single options (all but name,
+    SEED and task_key are arrays of equal length) as pandas.DataFrame
+    with the columns of the option_results table. '''
+    values = [np.full(len(run), name, dtype=object),
+              np.full(len(run), SEED, dtype='i8'),
+              np.full(len(run), task_key, dtype=object), run, maturity,
+              strike, estimate, benchmark, std_error, time_sec]
+    return pd.DataFrame(dict((column, np.asarray(value, dtype=dtype))
+                             for (column, dtype), value
+                             in zip(OPTION_COLUMNS, values)),
+                        columns=[column for column, _ in OPTION_COLUMNS])
+
+
+def write_to_database(sim_results, filename=filename):
     ''' Write pandas.DataFrame sim_results in HDFStore. '''
     h5 = pd.HDFStore(filename, 'a')
-    h5.append('sim_results', sim_results, min_itemsize={'values': 30},
-               ignore_index=True)
+    h5.append('sim_results', sim_results, data_columns=DATA_COLUMNS,
+              min_itemsize=min_itemsize)
     h5.close()
 
 
-def print_results_long(filename=filename, idl=0, idh=50):
+class ResultsWriter(object):
+    ''' Buffers result rows in preallocated column arrays and appends
+    them to the HDFStore table in batches. The store is opened and closed
+    for every batch, i.e. at most one batch is lost if a study crashes;
+    the costs per row do not grow with the number of rows written.
+    Per-option results (see option_table) of the buffered rows are
+    written with the same batch to the compressed option_results table.
+
+    filename: string
+        HDFStore for the results
+    batch_size: int
+        number of rows per write
+    key: string
+        name of the table in the HDFStore
+    '''
+
+    def __init__(self, filename=filename, batch_size=10, key='sim_results'):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.key = key
+        self.columns = dict((name, np.empty(batch_size, dtype=dtype))
+                            for name, dtype in RESULT_COLUMNS)
+        self.options = []  # per-option results of the buffered rows
+        self.n = 0  # rows in buffer
+        self.written = 0  # rows written by this writer
+
+    def append(self, row, options=None):
+        ''' Adds a result row (dict, see result_row) and optionally the
+        results per option (pandas.DataFrame, see option_table) to the
+        buffer and writes the buffer if it is full. '''
+        for name, _ in RESULT_COLUMNS:
+            self.columns[name][self.n] = row[name]
+        if options is not None:
+            self.options.append(options)
+        self.n += 1
+        if self.n == self.batch_size:
+            self.flush()
+
+    def flush(self):
+        ''' Appends the buffered rows to the HDFStore table. '''
+        if self.n == 0:
+            return
+        h5 = pd.HDFStore(self.filename, 'a')
+        try:
+            start = h5.get_storer(self.key).nrows if self.key in h5 else 0
+            batch = pd.DataFrame(dict((name, self.columns[name][:self.n])
+                                      for name, _ in RESULT_COLUMNS),
+                                 columns=[name for name, _ in RESULT_COLUMNS],
+                                 index=np.arange(start, start + self.n))
+            if self.options:
+                options = pd.concat(self.options, ignore_index=True)
+                offset = (h5.get_storer('option_results').nrows
+                          if 'option_results' in h5 else 0)
+                options.index = options.index + offset
+                h5.append('option_results', options,
+                          data_columns=OPTION_DATA_COLUMNS,
+                          min_itemsize=min_itemsize,
+                          complib=complib, complevel=complevel)
+            # sim_results last: a configuration counts as completed only
+            # if its per-option results have been written as well
+            h5.append(self.key, batch, data_columns=DATA_COLUMNS,
+                      min_itemsize=min_itemsize)
+        finally:
+            h5.close()
+        self.written += self.n
+        self.options = []
+        self.n = 0
+        self.columns['sim_name'][:] = None  # release references
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()  # also on errors: keep what has been computed
+        return False
+
+
+def remove_orphan_options(filename=filename):
+    ''' Removes the rows of the option_results table whose configuration
+    (sim_name, seed, task_key) is missing in the sim_results table; such
+    rows are
+    left if a write was interrupted between the two appends (see
+    ResultsWriter.flush) and would be duplicated when the configuration
+    is run again.
+
+    filename: string
+        HDFStore with pandas.DataFrame with results
+
+    Returns
+    =======
+    removed: int
+        number of rows removed
+    '''
+    try:
+        h5 = pd.HDFStore(filename, 'r+')  # existing store only
+    except (IOError, OSError):
+        return 0
+    try:
+        if 'option_results' not in h5:
+            return 0
+        options = set(zip(h5.select_column('option_results', 'sim_name'),
+                          h5.select_column('option_results', 'seed'),
+                          h5.select_column('option_results', 'task_key')))
+        done = set()
+        if 'sim_results' in h5:
+            done = h5.select('sim_results',
+                             columns=['sim_name', 'seed', 'task_key'])
+            done = set(zip(done['sim_name'], done['seed'],
+                           done['task_key']))
+        removed = 0
+        for sim_name, seed, key in sorted(options - done):
+            removed += h5.remove('option_results',
+                                 where='sim_name == %r & seed == %d '
+                                       '& task_key == %r'
+                                       % (sim_name, seed, key))
+        return removed
+    finally:
+        h5.close()
+
+
+def index_results(filename=filename, chunksize=10000):
+    ''' Rewrites the sim_results and option_results tables written by
+    earlier versions (without data columns or without the qmc, grid mode
+    or task_key columns) as indexed tables; tables already indexed are
+    left untouched. The missing flags are taken from the name (see
+    simulation_name), the task_key of such rows is empty.
+
+    filename: string
+        HDFStore with pandas.DataFrame with results
+    chunksize: int
+        number of rows copied at a time
+    '''
+    h5 = pd.HDFStore(filename, 'a')
+    try:
+        for key, columns, data_columns, kwargs in [
+                ('sim_results', RESULT_COLUMNS, DATA_COLUMNS, {}),
+                ('option_results', OPTION_COLUMNS, OPTION_DATA_COLUMNS,
+                 {'complib': complib, 'complevel': complevel})]:
+            if key not in h5 or set(data_columns) <= set(
+                    h5.get_storer(key).data_columns):
+                continue
+            if key + '_indexed' in h5:
+                h5.remove(key + '_indexed')
+            for chunk in h5.select(key, chunksize=chunksize):
+                for name, pattern in name_flags:
+                    if key == 'sim_results' and name not in chunk:
+                        chunk[name] = chunk['sim_name'].str.contains(pattern)
+                if 'task_key' not in chunk:
+                    chunk['task_key'] = ''
+                chunk = chunk[[name for name, _ in columns]]
+                h5.append(key + '_indexed', chunk, data_columns=data_columns,
+                          min_itemsize=min_itemsize, **kwargs)
+            h5.remove(key)
+            h5.get_node(key + '_indexed')._f_rename(key)
+    finally:
+        h5.close()
+
+
+def query_results(where=None, columns=None, filename=filename,
+                  start=None, stop=None, chunksize=1000, key='sim_results'):
+    ''' Streams the rows of the sim_results table matching a query; the
+    conditions are evaluated by PyTables on disk (using the indexes of
+    the data columns), only matching rows are read.
+
+    where: string or None
+        conditions on the columns DATA_COLUMNS, e.g.
+        "paths > 50000 & anti_paths == True" (None: all rows);
+        for the option_results table: OPTION_DATA_COLUMNS
+    columns: list or None
+        columns to be read (None: all columns)
+    filename: string
+        HDFStore with pandas.DataFrame with results
+    start, stop: int or None
+        range of rows (row numbers) to be searched; the conditions are
+        applied to these rows only
+    chunksize: int
+        number of rows read at a time
+    key: string
+        table to be queried ('sim_results' or 'option_results')
+
+    Returns
+    =======
+    chunks: generator
+        pandas.DataFrame objects with (at most chunksize) matching rows
+    '''
+    h5 = pd.HDFStore(filename, 'r')
+    try:
+        coordinates = h5.select_as_coordinates(key, where, start=start,
+                                               stop=stop)
+            # row numbers of the matching rows within start:stop
+        for i in range(0, len(coordinates), chunksize):
+            yield h5.select(key, where=coordinates[i:i + chunksize],
+                            columns=columns)
+    finally:
+        h5.close()
+
+
+def option_results(sim_name, seed=None, filename=filename, where=None):
+    ''' Returns the per-option results of a configuration.
+
+    sim_name: string
+        name of the configuration
+    seed: int or None
+        seed value of the configuration (None: all seeds)
+    filename: string
+        HDFStore with pandas.DataFrame with results
+    where: string or None
+        further conditions, e.g. "maturity > 0.5 & strike == 20." or
+        "task_key == %r" % key (to select one set of parameters)
+
+    Returns
+    =======
+    options: pandas.DataFrame
+        rows of the option_results table
+    '''
+    conditions = ['sim_name == %r' % sim_name]
+    if seed is not None:
+        conditions.append('seed == %d' % seed)
+    if where is not None:
+        conditions.append('(%s)' % where)
+    chunks = list(query_results(' & '.join(conditions), filename=filename,
+                                chunksize=100000, key='option_results'))
+    if not chunks:
+        return option_table(sim_name, 0, [], [], [], [], [], [], [])
+    return pd.concat(chunks)
+
+
+def count_results(filename=filename):
+    ''' Number of rows in the sim_results table (without reading it). '''
+    h5 = pd.HDFStore(filename, 'r')
+    try:
+        return h5.get_storer('sim_results').nrows
+    finally:
+        h5.close()
+
+
+def print_results_long(filename=filename, idl=0, idh=50, where=None):
     ''' Prints valuation results in detailed form.
     filename: string
         HDFStore with pandas.DataFrame with results
     idl: int
-        start index value
+        start index value (first row number)
     idh: int
-        stop index value
+        stop index value (last row number, included)
+    where: string or None
+        query conditions (see query_results), applied to the rows
+        idl to idh
     '''
-    h5 = pd.HDFStore(filename, 'r')
-    sim_results = h5['sim_results']
     br = "----------------------------------------------------"
-    for i in range(idl, min(len(sim_results), idh + 1)):
-        row = sim_results.iloc[i]
-        print br
-        print "Start Calculations  %32s" % row['start_date'] + "\n" + br
-        print "ID Number           %32d" % i
-        print "Name of Simulation  %32s" % row['sim_name']
-        print "Seed Value for RNG  %32d" % row['seed']
-        print "Number of Runs      %32d" % row['runs']
-        print "Time Steps          %32d" % row['time_steps']
-        print "Paths               %32d" % row['paths']
-        print "Moment Matching     %32s" % row['mo_match']
-        print "Antithetic Paths    %32s" % row['anti_paths'] + "\n"
-        print "Option Prices       %32d" % row['opt_prices']
-        print "Absolute Tolerance  %32.4f" % row['abs_tol']
-        print "Relative Tolerance  %32.4f" % row['rel_tol']
-        print "Errors              %32d" % row['errors']
-        print "Error Ratio         %32.4f" % row['error_ratio'] + "\n"
-        print "Aver Val Error      %32.4f" % row['av_val_err']
-        print "Aver Abs Val Error  %32.4f" % row['ab_val_err']
-        print "Time in Seconds     %32.4f" % row['time_sec']
-        print "Time in Minutes     %32.4f" % row['time_min']
-        print "Time per Option     %32.4f" % row['time_opt'] + "\n" + br
-        print "End Calculations    %32s" % row['end_date'] \
-                 + "\n" + br + "\n"
-    print "Total number of rows in table %d" % len(sim_results)
-    h5.close()
+    for chunk in query_results(where, filename=filename,
+                               start=idl, stop=idh + 1):
+        for i, row in chunk.iterrows():
+            print(br)
+            print("Start Calculations  %32s" % row['start_date'] + "\n" + br)
+            print("ID Number           %32d" % i)
+            print("Name of Simulation  %32s" % row['sim_name'])
+            print("Seed Value for RNG  %32d" % row['seed'])
+            print("Number of Runs      %32d" % row['runs'])
+            print("Time Steps          %32d" % row['time_steps'])
+            print("Paths               %32d" % row['paths'])
+            print("Moment Matching     %32s" % row['mo_match'])
+            print("Antithetic Paths    %32s" % row['anti_paths'])
+            print("Sobol Sequences     %32s" % row['qmc'])
+            print("Shared Time Grid    %32s" % row['shared_paths'])
+            print("Steps per Maturity  %32s" % row['preserve_steps'] + "\n")
+            print("Option Prices       %32d" % row['opt_prices'])
+            print("Absolute Tolerance  %32.4f" % row['abs_tol'])
+            print("Relative Tolerance  %32.4f" % row['rel_tol'])
+            print("Errors              %32d" % row['errors'])
+            print("Error Ratio         %32.4f" % row['error_ratio'] + "\n")
+            print("Aver Val Error      %32.4f" % row['av_val_err'])
+            print("Aver Abs Val Error  %32.4f" % row['ab_val_err'])
+            print("Time in Seconds     %32.4f" % row['time_sec'])
+            print("Time in Minutes     %32.4f" % row['time_min'])
+            print("Time per Option     %32.4f" % row['time_opt']
+                  + "\n" + br)
+            print("End Calculations    %32s" % row['end_date']
+                     + "\n" + br + "\n")
+    print("Total number of rows in table %d" % count_results(filename))
 
 
-def plot_error_ratio(filename=filename):
-    ''' Show error ratio vs. paths * time_steps (i.e. granularity). '''
-    h5 = pd.HDFStore(filename, mode='r')
-    sim_results = h5['sim_results']
+def plot_error_ratio(filename=filename, where=None):
+    ''' Show error ratio vs. paths * time_steps (i.e. granularity); Sobol
+    (qmc) configurations are shown separately, the regression is over the
+    pseudo-random configurations.
+
+    where: string or None
+        query conditions (see query_results)
+    '''
+    chunks = list(query_results(where, ['paths', 'time_steps', 'error_ratio',
+                                        'qmc'],
+                                filename=filename, chunksize=100000))
+    sim_results = pd.concat(chunks)
     x = np.array(sim_results['paths'] * sim_results['time_steps'], dtype='d')
     x = x / max(x)
-    y = sim_results['error_ratio']
+    y = np.array(sim_results['error_ratio'], dtype='d')
+    qmc = np.array(sim_results['qmc'], dtype=bool)
+    x, y, xq, yq = x[~qmc], y[~qmc], x[qmc], y[qmc]
     plt.plot(x, y, 'bo', label='error ratio')
-    rg = np.polyfit(x, y, deg=1)
-    plt.plot(np.sort(x), np.polyval(rg, np.sort(x)), 'r', label='regression',
-             linewidth=2)
+    if qmc.any():
+        plt.plot(xq, yq, 'g^', label='error ratio (qmc)')
+    if len(x) > 1:
+        rg = np.polyfit(x, y, deg=1)
+        plt.plot(np.sort(x), np.polyval(rg, np.sort(x)), 'r',
+                 label='regression', linewidth=2)
     plt.xlabel('time steps * paths (normalized)')
     plt.ylabel('errors / option valuations')
     plt.legend()
     plt.grid(True)
-    h5.close()
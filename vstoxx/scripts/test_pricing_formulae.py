@@ -0,0 +1,184 @@
+#
+# Accuracy tests for the tail probability backends of
+# the Gruenbichler-Longstaff (1996) pricing formulae
+# -- run with: python -m pytest test_pricing_formulae.py
+#
+# (c) The Python Quants GmbH
+# For illustration purposes only.
+# August 2014
+#
+import math
+import numpy as np
+import scipy.stats as scs
+import scipy.special as scsp
+import pytest
+from pricing_formulae import (call_greeks, call_price, cx,
+                              generate_paths_qmc, gl96_factors, ncx2_sf,
+                              parallel_estimator)
+
+backends = ['cdf', 'sf', 'special', 'series']
+
+
+def gl96_arguments():
+    ''' (x, df, nc) triples of the GL96 formulae for realistic parameters,
+    maturities from one week to two years and strikes from deep in the
+    money to far out of the money (including the df shifts 0, 2, 4). '''
+    V0, theta_V, zeta_V = 17.5, 20.0, 0.
+    kappa_V, sigma_V, T, K = np.meshgrid([0.1, 1.0, 3.0, 10.0],
+                                         [0.5, 1.0, 3.2, 8.0, 20.0],
+                                         [1. / 52, 1. / 12, 0.5, 2.0],
+                                         [5., 15., 20., 32.5, 60., 100.])
+    _, _, gamma, nu, lambda_V = gl96_factors(V0, kappa_V, theta_V, sigma_V,
+                                             zeta_V, T)
+    x = np.concatenate([(gamma * K).ravel()] * 3)
+    df = np.concatenate([(nu + shift).ravel() for shift in (0, 2, 4)])
+    nc = np.concatenate([lambda_V.ravel()] * 3)
+    return x, df, nc
+
+
+def reference_sf(x, df, nc):
+    ''' Reference value of the survival function far in the tail, in
+    logs: Poisson-weighted sum of central tails, each from the continued
+    fraction of the upper incomplete gamma function (valid for the terms
+    with x / 2 > df / 2 + j + 1; the others are negligible far in the
+    tail). '''
+    y, mu = x / 2., nc / 2.
+    logs = []
+    for j in range(int(y - df / 2. - 1)):
+        a = df / 2. + j
+        # modified Lentz algorithm for the continued fraction
+        b = y + 1 - a
+        c, d = 1e300, 1 / b
+        h = d
+        for i in range(1, 10000):
+            an = -i * (i - a)
+            b += 2
+            d = 1 / (an * d + b)
+            c = b + an / c
+            h *= d * c
+            if abs(d * c - 1) < 1e-16:
+                break
+        logs.append(scsp.xlogy(j, mu) - mu - scsp.gammaln(j + 1)
+                    + a * math.log(y) - y - scsp.gammaln(a) + math.log(h))
+    return math.exp(scsp.logsumexp(logs))
+
+
+@pytest.mark.parametrize('backend', backends)
+def test_backends_absolute(backend):
+    ''' All backends agree with 1 - ncx2.cdf and ncx2.sf in absolute
+    terms over the GL96 argument ranges. '''
+    x, df, nc = gl96_arguments()
+    value = cx(x, 1., df, nc, backend=backend)
+    np.testing.assert_allclose(value, 1 - scs.ncx2.cdf(x, df, nc),
+                               rtol=0, atol=1e-12)
+    np.testing.assert_allclose(value, scs.ncx2.sf(x, df, nc),
+                               rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('backend', ['sf', 'series'])
+def test_backends_relative(backend):
+    ''' The cancellation-free backends agree with ncx2.sf in relative
+    terms, including the far tail (scipy's ncx2.sf itself loses
+    accuracy below about 1e-200). '''
+    x, df, nc = gl96_arguments()
+    reference = scs.ncx2.sf(x, df, nc)
+    select = reference > 1e-200
+    value = cx(x, 1., df, nc, backend=backend)
+    np.testing.assert_allclose(value[select], reference[select],
+                               rtol=1e-9)
+
+
+@pytest.mark.parametrize('kappa_V, sigma_V, T, K', [
+    (0.1, 1.0, 1. / 12, 60.),
+    (0.1, 3.2, 1. / 52, 32.5),
+    (3.0, 3.2, 1. / 12, 60.),
+    (0.1, 1.0, 1. / 52, 45.)])
+def test_series_far_tail(kappa_V, sigma_V, T, K):
+    ''' Deep out of the money, the series keeps full relative precision
+    (reference from an independent evaluation in logs). '''
+    _, _, gamma, nu, lambda_V = gl96_factors(17.5, kappa_V, 20.0, sigma_V,
+                                             0., T)
+    for shift in (0, 2, 4):
+        expected = reference_sf(gamma * K, nu + shift, lambda_V)
+        assert expected > 0
+        assert ncx2_sf(gamma * K, nu + shift, lambda_V) == pytest.approx(
+            expected, rel=1e-10, abs=0)
+
+
+@pytest.mark.parametrize('backend', backends)
+def test_backends_infinite_argument(backend):
+    ''' The tail probability vanishes for x = inf (as ncx2.sf). '''
+    df = np.array([0.5, 3.0, 30.0])
+    nc = np.array([0.0, 2.0, 500.0])
+    value = cx(np.full(3, np.inf), 1., df, nc, backend=backend)
+    np.testing.assert_array_equal(value, scs.ncx2.sf(np.inf, df, nc))
+    np.testing.assert_array_equal(value, 0.)
+
+
+@pytest.mark.parametrize('backend', backends)
+def test_call_price_backends(backend):
+    ''' Option values do not depend on the backend (within the absolute
+    accuracy of the 'cdf' backend). '''
+    K = np.linspace(5., 60., 23)
+    T = np.array([1. / 52, 1. / 12, 0.5, 2.0])[:, np.newaxis]
+    for sigma_V in (0.5, 3.2, 20.0):
+        np.testing.assert_allclose(
+            call_price(17.5, 3.0, 20.0, sigma_V, 0., T, 0.01, K,
+                       backend=backend),
+            call_price(17.5, 3.0, 20.0, sigma_V, 0., T, 0.01, K),
+            rtol=0, atol=1e-10)
+
+
+@pytest.mark.parametrize('sigma_V', [3.2, 20.0])
+@pytest.mark.parametrize('greek, parameter, step, sign', [
+    ('delta', 'V0', 1e-4, 1), ('theta', 'T', 1e-6, -1),
+    ('kappa_V', 'kappa_V', 1e-5, 1), ('theta_V', 'theta_V', 1e-5, 1),
+    ('sigma_V', 'sigma_V', 1e-5, 1), ('gamma', 'V0', 1e-3, 1)])
+def test_call_greeks(sigma_V, greek, parameter, step, sign):
+    ''' The Greeks agree with bump-and-reprice of call_price over
+    strike and maturity arrays, for d > 1 (sigma_V = 3.2) and d <= 1
+    (sigma_V = 20.0). '''
+    args = {'V0': 17.5, 'kappa_V': 3.0, 'theta_V': 20.0,
+            'sigma_V': sigma_V, 'zeta_V': 0., 'r': 0.01,
+            'T': np.array([1. / 12, 0.5, 2.0])[:, np.newaxis],
+            'K': np.array([15., 17.5, 20., 25., 30.])}
+
+    def bumped(h):
+        bump = dict(args)
+        bump[parameter] = args[parameter] + h
+        return call_price(**bump)
+    greeks = call_greeks(**args)
+    if greek == 'gamma':
+        expected = (bumped(step) - 2 * bumped(0.) + bumped(-step)) / step ** 2
+    else:
+        expected = sign * (bumped(step) - bumped(-step)) / (2 * step)
+    np.testing.assert_allclose(greeks['price'], call_price(**args),
+                               rtol=0, atol=1e-12)
+    np.testing.assert_allclose(greeks[greek], expected, rtol=0, atol=1e-6)
+
+
+@pytest.mark.parametrize('sigma_V', [3.2, 20.0])
+@pytest.mark.parametrize('terminal_only', [False, True])
+def test_qmc_block_size(sigma_V, terminal_only):
+    ''' The blockwise Sobol paths do not depend on the block size. '''
+    paths = [generate_paths_qmc(17.5, 3.0, 20.0, sigma_V, 0.5, 8, 1024,
+                                terminal_only=terminal_only, seed=7,
+                                block_size=block_size)
+             for block_size in (1024, 256, 128)]
+    for x in paths[1:]:
+        np.testing.assert_array_equal(x, paths[0])
+
+
+@pytest.mark.parametrize('sigma_V', [3.2, 20.0])
+def test_parallel_estimator_workers(sigma_V):
+    ''' The parallel estimates are bit-identical for any number of
+    workers (including the last, shorter chunk). '''
+    K = np.array([15., 20., 25.])
+    results = [parallel_estimator(17.5, 3.0, 20.0, sigma_V, 0.5, 0.01, K,
+                                  10, 5000, chunk_size=1200, seed=42,
+                                  workers=workers, anti_paths=True)
+               for workers in (1, 2)]
+    for key in ('price', 'std_error', 'paths', 'seed'):
+        np.testing.assert_array_equal(results[1][key], results[0][key])
+    np.testing.assert_array_equal(results[1]['conf_int'],
+                                  results[0]['conf_int'])